@@ -0,0 +1,239 @@
+import numpy as np
+
+from topology import as_topology
+
+"""
+Bit-parallel synchronous integer threshold model
+
+With integer exposures, the threshold rule only needs one bit of state per
+(node, replicate). We pack 64 replicates into each uint64 word, so node i's
+state is a row of W = ceil(R / 64) words, and every word op advances 64
+cascades at once
+
+Exposure counts are bit-sliced: plane b holds bit b of every count, one
+(n x W) word array per bit. An epoch recounts from zero, walking the CSR
+arrays one degree slot at a time: slot d adds each node's d-th neighbor's
+active word into its counter with a ripple-carry add over the planes.
+Nodes are relabelled by decreasing degree, so the nodes that have a d-th
+neighbor are a prefix and every add works on a slice
+
+Thresholds are compared bitwise as well. exposure >= t is the same as
+exposure >= ceil(t) for integer exposures, so we store ceil(t) bit-sliced and
+run a magnitude comparator from the top plane down
+
+Classes:
+    - BitThresholdSim
+"""
+
+WORD = 64
+
+def pack_bits(bits):
+    """
+    (n x R) bool -> (n x W) uint64, replicate r is bit r % 64 of word r // 64
+    """
+    n, n_reps = bits.shape
+    padded = np.zeros((n, -(-n_reps // WORD) * WORD), dtype=bool)
+    padded[:, :n_reps] = bits
+    return np.packbits(padded, axis=1, bitorder='little').view('<u8')
+
+def unpack_words(words):
+    """
+    (k,) uint64 -> (k x 64) uint8 bits
+    """
+    return np.unpackbits(
+        np.ascontiguousarray(words, dtype='<u8').view(np.uint8).reshape(-1, 8),
+        axis=1,
+        bitorder='little',
+    )
+
+class BitThresholdSim(object):
+    """
+    - inputs
+        g: a graph or CSRGraph
+        thresholds: (n_nodes x R) matrix, row i is node i in g's node order
+    - outputs
+        same as BatchThresholdSim: replicate_columns(rep)
+
+    Same dynamics and output as BatchThresholdSim, including the random
+    activation order within an epoch
+    """
+    def __init__(self, g, thresholds, rng=None):
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.topology = as_topology(g)
+        self.threshold = np.asarray(thresholds, dtype=float)
+        n, self.n_reps = self.threshold.shape
+        assert n == self.topology.n
+        self.n = n
+
+        # relabel by decreasing degree, rank[i] is node i's new index
+        degree = self.topology.degree
+        self.order = np.argsort(-degree, kind='stable')
+        self.rank = np.empty(n, dtype=np.int64)
+        self.rank[self.order] = np.arange(n)
+        sorted_degree = degree[self.order]
+        max_degree = int(sorted_degree[0]) if n > 0 else 0
+        self.n_planes = max(1, max_degree.bit_length())
+        indptr = self.topology.indptr
+        indices = self.topology.indices
+        # slot d: the d-th neighbor of each node with degree > d
+        self.slots = []
+        for d in range(max_degree):
+            n_d = np.count_nonzero(sorted_degree > d)
+            self.slots.append(self.rank[indices[indptr[self.order[:n_d]] + d]])
+
+        # ceil(t) bit-sliced, and replicates a node can never reach
+        need = np.ceil(self.threshold[self.order])
+        never = need > sorted_degree[:, None]
+        need = np.clip(need, 0, 2 ** self.n_planes - 1).astype(np.int64)
+        self.threshold_planes = [
+            pack_bits((need >> b) & 1 == 1) for b in range(self.n_planes)
+        ]
+        # padding bits past R never activate either
+        self.can_activate = ~pack_bits(never) & pack_bits(
+            np.ones((1, self.n_reps), dtype=bool)
+        )
+        self.n_words = self.can_activate.shape[1]
+        self.active = np.zeros((n, self.n_words), dtype=np.uint64)
+        self.prev_count = None
+        self.n_epochs = 0
+
+        # outputs by rank, -1 for missing
+        self.before_exposure = np.full((n, self.n_reps), -1, dtype=np.int32)
+        self.exposure_at_activation = np.full(
+            (n, self.n_reps),
+            -1,
+            dtype=np.int32,
+        )
+        self.activation_order = np.full((n, self.n_reps), -1, dtype=np.int32)
+        self.n_activated = np.zeros(self.n_reps, dtype=np.int64)
+
+    def count_exposure(self):
+        """
+        Bit planes of every (node, replicate) active neighbor count
+        """
+        planes = [
+            np.zeros((self.n, self.n_words), dtype=np.uint64)
+            for _ in range(self.n_planes)
+        ]
+        for src in self.slots:
+            x = self.active[src]
+            k = len(src)
+            for plane in planes:
+                p = plane[:k]
+                carry = p & x
+                p ^= x
+                x = carry
+                if not x.any():
+                    break
+        return planes
+
+    def meets_threshold(self, planes):
+        """
+        Words with bit set where count >= ceil(threshold)
+        """
+        greater = np.zeros((self.n, self.n_words), dtype=np.uint64)
+        equal = ~greater
+        for c, t in zip(reversed(planes), reversed(self.threshold_planes)):
+            greater |= equal & c & ~t
+            equal &= ~(c ^ t)
+        return (greater | equal) & self.can_activate
+
+    def set_bits(self, words):
+        """
+        Node rank, word and bit of every set bit of words
+        """
+        rows, cols = np.nonzero(words)
+        hit_row, hit_bit = np.nonzero(unpack_words(words[rows, cols]))
+        return rows[hit_row], cols[hit_row], hit_bit
+
+    def read_counts(self, planes, rows, cols, bits):
+        """
+        The counts the planes hold at the given bits
+        """
+        shift = bits.astype(np.uint64)
+        values = np.zeros(len(rows), dtype=np.int32)
+        for b, plane in enumerate(planes):
+            bit = (plane[rows, cols] >> shift) & np.uint64(1)
+            values |= bit.astype(np.int32) << b
+        return values
+
+    def simulation_epoch(self):
+        """
+        One synchronous update of every replicate
+        Returns the number of newly active (node, replicate) pairs
+        """
+        count = self.count_exposure()
+        newly = self.meets_threshold(count) & ~self.active
+        self.n_epochs += 1
+        if not newly.any():
+            # final exposure of everyone left inactive
+            inactive = ~self.active & pack_bits(
+                np.ones((1, self.n_reps), dtype=bool)
+            )
+            rows, cols, bits = self.set_bits(inactive)
+            reps = cols * WORD + bits
+            self.before_exposure[rows, reps] = self.read_counts(
+                count,
+                rows,
+                cols,
+                bits,
+            )
+            return 0
+        rows, cols, bits = self.set_bits(newly)
+        reps = cols * WORD + bits
+        self.exposure_at_activation[rows, reps] = self.read_counts(
+            count,
+            rows,
+            cols,
+            bits,
+        )
+        if self.prev_count is not None:
+            self.before_exposure[rows, reps] = self.read_counts(
+                self.prev_count,
+                rows,
+                cols,
+                bits,
+            )
+        self.set_activation_order(rows, reps)
+        self.active |= newly
+        self.prev_count = count
+        return len(rows)
+
+    def set_activation_order(self, rows, cols):
+        # shuffle, then a stable sort by replicate
+        order = self.rng.permutation(len(rows))
+        order = order[np.argsort(cols[order], kind='stable')]
+        rows = rows[order]
+        cols = cols[order]
+        counts = np.bincount(cols, minlength=self.n_reps)
+        starts = np.cumsum(counts) - counts
+        rank = np.arange(len(rows)) - np.repeat(starts, counts)
+        self.activation_order[rows, cols] = self.n_activated[cols] + rank + 1
+        self.n_activated += counts
+
+    def dynamics(self):
+        """
+        Runs until no replicate activates a node, returns self
+        """
+        while self.simulation_epoch() > 0:
+            pass
+        return self
+
+    def replicate_columns(self, rep):
+        """
+        State of one replicate as {column: array}, in g's node order
+        Floats with NaN for missing, like BatchThresholdSim
+        """
+        def by_node(arr):
+            col = arr[self.rank, rep].astype(float)
+            col[col < 0] = np.nan
+            return col
+        word, bit = divmod(rep, WORD)
+        active = (self.active[self.rank, word] >> np.uint64(bit)) & np.uint64(1)
+        return {
+            'active': active.astype(np.int8),
+            'before_exposure': by_node(self.before_exposure),
+            'exposure_at_activation': by_node(self.exposure_at_activation),
+            'activation_order': by_node(self.activation_order),
+            'threshold': self.threshold[:, rep],
+        }
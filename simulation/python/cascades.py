@@ -1,11 +1,12 @@
 import random
-import networkx as nx
 import pandas as pd
 import numpy as np
-import csv
+
+from node_order import ShuffledIndex
 
 """
 Classes:
+    - SimColumns
     - BaseSim
     - ICMBase(BaseSim)
     - ThresholdBase(BaseSim)
@@ -17,12 +18,78 @@ Classes:
 See BaseSim for important methods
 
 Functions:
+    - closest_twentieth
     - normal_threhsold_distribution
     - exponential_threshold_distribution
     - uniform_threshold_distribution
 
 """
 
+#### Output ####################################################################
+
+TWENTIETHS = np.linspace(0, 1, num=21)
+
+def closest_twentieth(x):
+    """
+    Nearest of TWENTIETHS elementwise, NaN stays NaN
+
+    Same as an argmin over all 21 bins, ties included (they go to the lower
+    bin), but only the bins next to floor(20 * x) are compared
+    """
+    x = np.asarray(x, dtype=float)
+    lo = np.nan_to_num(np.clip(np.floor(x * 20), 0, 20)).astype(np.int64)
+    # x * 20 can round across an integer, so look one bin further each way
+    cand = TWENTIETHS[np.clip(lo[..., None] + np.arange(-1, 2), 0, 20)]
+    pick = np.argmin(np.abs(cand - x[..., None]), axis=-1)
+    nearest = np.take_along_axis(cand, pick[..., None], axis=-1)[..., 0]
+    return np.where(np.isnan(x), np.nan, nearest)[()]
+
+
+class SimColumns(object):
+    """
+    - inputs
+        columns: {col name: array}, one entry per node, NaN for missing
+        name: model name, repeated on every record
+        int_cols: columns that hold counts and are written as ints
+    - outputs
+        records(): [{node1_data}, {node2_data}, ...] built on demand
+
+    Columnar output of one simulation run. Keep it columnar for analysis
+    (to_dataframe) and only materialize dicts when a writer needs them
+    """
+    def __init__(self, columns, name, int_cols=()):
+        self.columns = columns
+        self.name = name
+        self.int_cols = set(int_cols)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+    def __getitem__(self, col):
+        return self.columns[col]
+
+    def column_values(self, col):
+        """
+        Python values of one column, None where missing
+        """
+        vals = self.columns[col].tolist()
+        if col in self.int_cols:
+            return [None if v != v else int(v) for v in vals]
+        return [None if v != v else v for v in vals]
+
+    def records(self):
+        cols = list(self.columns.keys())
+        all_vals = [self.column_values(col) for col in cols]
+        for row in zip(*all_vals):
+            record = dict(zip(cols, row))
+            record['name'] = self.name
+            yield record
+
+    def to_dataframe(self):
+        df = pd.DataFrame(self.columns)
+        df['name'] = self.name
+        return df
+
 #### Simulation base class #####################################################
 
 class BaseSim(object):
@@ -36,6 +103,11 @@ class BaseSim(object):
     Provides standard methods for sim dynamics, stopping rule, output
     Override the rest yourself
     """
+    # columns that hold neighbor counts, used by generate_columns
+    int_cols = set()
+    # inactive node positions, see get_inactive_itr
+    inactive_index = None
+
     def __init__(self):
         """
         We store arguments on the class
@@ -80,27 +152,54 @@ class BaseSim(object):
             record['name'] = self.name
         return records
 
-    def dynamics(self):
+    def generate_columns(self):
+        """
+        Generates a SimColumns for output, copying out of the node dicts
+        """
+        records = [attr for n, attr in self.g.nodes_iter(data=True)]
+        columns = {
+            col: np.array([record[col] for record in records], dtype=float)
+            for col in records[0].keys()
+            if col != 'name'
+        }
+        columns['active'] = columns['active'].astype(np.int8)
+        return SimColumns(columns, self.name, self.int_cols)
+
+    def dynamics(self, columnar=False):
         """
         Method to run the simulation and return output
+        columnar=True returns a SimColumns instead of records
         - This method should not be overriden
         """
         while True:
             self.simulation_epoch()
             if self.stop_rule():
                 break
+        if columnar:
+            return self.generate_columns()
         return self.generate_output()
 
     def get_inactive_itr(self):
-        if len(self.inactive_set) > 0:
-            inactive_itr = np.random.choice(
-                list(self.inactive_set),
-                size=len(self.inactive_set),
-                replace=False,
+        """
+        Inactive nodes in random order
+
+        Like array_cascades, the order lives in a ShuffledIndex over node
+        positions, built on first call. Afterwards we drop the last epoch's
+        newly_active_set and reshuffle in place
+        """
+        if self.inactive_index is None:
+            self.nodes = self.g.nodes()
+            self.node_pos = {n: idx for idx, n in enumerate(self.nodes)}
+            self.inactive_index = ShuffledIndex(
+                len(self.nodes),
+                [self.node_pos[n] for n in self.inactive_set],
             )
         else:
-            inactive_itr = []
-        return inactive_itr
+            self.inactive_index.remove_many(
+                [self.node_pos[n] for n in self.newly_active_set]
+            )
+        self.inactive_index.shuffle(np.random)
+        return [self.nodes[idx] for idx in self.inactive_index.view()]
 
 #### Intermediate classes based on sim type ####################################
 
@@ -108,15 +207,22 @@ class ICMBase(BaseSim):
     """
     You need to definite __init__ and simulation_epoch in subclass
     """
+    int_cols = set([
+        'before_exposure',
+        'exposure_at_activation',
+        'critical_exposure',
+    ])
+
     def __init__(self):
         raise NotImplementedError
 
     def preprocess_graph(self, g):
         """
         Called once to add the appropriate fields to the graph
-        Returns a graph copy
+        Labels and returns a copy, the input graph is left untouched
 
         """
+        g = g.copy()
         seed_nodes = set(random.sample(
             list(g.node.keys()), # list to sample from
             round(self.s * len(g)), # number of seeds
@@ -128,7 +234,7 @@ class ICMBase(BaseSim):
             attr['before_exposure'] = None
             attr['exposure_at_activation'] = None
             attr['critical_exposure'] = None
-        return g.copy()
+        return g
 
     def simulation_epoch(self):
         raise NotImplementedError
@@ -154,15 +260,16 @@ class ThresholdBase(BaseSim):
     def preprocess_graph(self, g, t):
         """
         Called once to add the appropriate fields to the graph
-        Returns a graph copy
+        Labels and returns a copy, the input graph is left untouched
         """
+        g = g.copy()
         for n, attr in g.nodes_iter(data=True):
             attr['active'] = 0
             attr['before_exposure'] = None
             attr['exposure_at_activation'] = None
             attr['critical_exposure'] = t[n]
             attr['threshold'] = t[n]
-        return g.copy()
+        return g
 
     def simulation_epoch(self):
         raise NotImplementedError
@@ -263,7 +370,7 @@ class ICMPushModel(ICMBase):
                 nbr_attr = self.g.node[nbr_idx]
                 if nbr_attr['active'] == 1:
                     continue
-                nbr_nbrs = g[nbr_idx].keys()
+                nbr_nbrs = self.g[nbr_idx].keys()
                 nbr_active_nbrs = sum(
                     [self.g.node[x]['active'] for x in nbr_nbrs]
                 )
@@ -288,6 +395,8 @@ class IntThresholdModel(ThresholdBase):
     Threshold model where each node has an integer activation threshold
     """
     name='int_thresh'
+    int_cols = set(['before_exposure', 'exposure_at_activation'])
+
     def simulation_epoch(self):
         """
         One update run of the simulation
@@ -313,7 +422,7 @@ class FracThresholdModel(ThresholdBase):
     Threshold model where each node has a fractional threshold
     """
     name='frac_thresh'
-    bins = np.linspace(0,1,num=21)
+    bins = TWENTIETHS
 
     def simulation_epoch(self):
         """
@@ -335,65 +444,77 @@ class FracThresholdModel(ThresholdBase):
                 attr['before_exposure'] = frac_active_nbrs
         self.inactive_set = self.inactive_set - self.newly_active_set
 
+    binned_cols = [
+        'critical_exposure',
+        'before_exposure',
+        'threshold',
+        'exposure_at_activation',
+    ]
+
     def closest_twentieth(self, num):
         if num is None:
             return None
-        vec = np.zeros(len(self.bins)) + num
-        # argmin of the abs val min
-        argmin = np.argmin(
-            np.abs(self.bins - vec)
-        )
-        return self.bins[argmin]
+        return closest_twentieth(num)
+
+    def generate_columns(self):
+        """
+        Generates a SimColumns with exposures and thresholds binned to the
+        closest twentieth, all nodes at once
+        """
+        sim_columns = super(FracThresholdModel, self).generate_columns()
+        for col in self.binned_cols:
+            sim_columns.columns[col] = closest_twentieth(sim_columns[col])
+        return sim_columns
 
     def generate_output(self):
         """
         Generates records for output
-        -
+        - Binned, see generate_columns
         """
-        records = [attr for n, attr in self.g.nodes_iter(data=True)]
-        for record in records:
-            record['name'] = self.name
-            record['critical_exposure'] = self.closest_twentieth(
-                record['critical_exposure']
-            )
-            record['before_exposure'] = self.closest_twentieth(
-                record['before_exposure']
-            )
-            record['threshold'] = self.closest_twentieth(
-                record['threshold']
-            )
-            record['exposure_at_activation'] = self.closest_twentieth(
-                record['exposure_at_activation']
-            )
-        return records
+        return list(self.generate_columns().records())
 
 #### distribution generating functions #########################################
 
-def set_seeds(th_vector, seed_frac):
+def set_seeds(th_vector, seed_frac, rng=None):
+    """
+    Sets thresholds to 0 until a fraction seed_frac of nodes are seeds
+    Draws from the global random state unless given a numpy Generator rng
+    """
     n_nodes = len(th_vector)
     seed_num = round(seed_frac * n_nodes)
     already_existing_seeds = sum([x <= 0.0 for x in th_vector])
     seeds_to_add = seed_num - already_existing_seeds
     if seeds_to_add > 0:
-        seed_idxs = random.sample(
-            range(n_nodes),
-            seeds_to_add,
-        )
+        if rng is None:
+            seed_idxs = random.sample(
+                range(n_nodes),
+                seeds_to_add,
+            )
+        else:
+            seed_idxs = rng.choice(n_nodes, seeds_to_add, replace=False)
         for idx in seed_idxs:
             th_vector[idx] = 0.0
     return th_vector
 
-def normal_threhsold_distribution(n=1000, mean=5, sd=1, seed_frac=0.01):
-    th = np.ceil(np.random.normal(loc=mean, scale=sd, size=n))
-    return set_seeds(np.array(th), seed_frac)
-
-def exponential_threshold_distribution(n=1000, beta=3, seed_frac=0.01):
-    th = np.ceil(np.random.exponential(scale=beta, size=n))
-    return set_seeds(np.array(th), seed_frac)
-
-def uniform_threshold_distribution(n=1000, min=0, max=10, seed_frac=0.01):
-    th = np.ceil(np.random.randint(0,10,size=gsize))
-    return set_seeds(np.array(th), seed_frac)
+def normal_threhsold_distribution(n=1000, mean=5, sd=1, seed_frac=0.01,
+                                  rng=None):
+    draw = np.random if rng is None else rng
+    th = np.ceil(draw.normal(loc=mean, scale=sd, size=n))
+    return set_seeds(np.array(th), seed_frac, rng=rng)
+
+def exponential_threshold_distribution(n=1000, beta=3, seed_frac=0.01,
+                                       rng=None):
+    draw = np.random if rng is None else rng
+    th = np.ceil(draw.exponential(scale=beta, size=n))
+    return set_seeds(np.array(th), seed_frac, rng=rng)
+
+def uniform_threshold_distribution(n=1000, min=0, max=10, seed_frac=0.01,
+                                   rng=None):
+    if rng is None:
+        th = np.random.randint(min, max, size=n)
+    else:
+        th = rng.integers(min, max, size=n)
+    return set_seeds(np.array(th, dtype=float), seed_frac, rng=rng)
 
 # diagnostic fns
 
@@ -404,99 +525,7 @@ def print_diagnostics(df):
 
 
 if __name__ == '__main__':
-    # seed = 42
-    # random.seed(seed)
-    p = 0.2
-    s = 0.05
-    gsize = 1000
-    n_runs = 100
-
-    count = 0
-
-    with open('/Users/g/Desktop/new_sim_runs.tsv', 'w') as outfile:
-        fieldnames = [
-            'active',
-            'before_exposure',
-            'exposure_at_activation',
-            'critical_exposure',
-            'threshold',
-            'name'
-        ]
-        w = csv.DictWriter(outfile, fieldnames=fieldnames, delimiter='\t')
-        w.writeheader()
-        for sim_idx in range(n_runs):
-            count += 1
-            g = nx.barabasi_albert_graph(gsize, 6)
-
-
-            # threshold dists
-            int_norm_dist = normal_threhsold_distribution(
-                n=len(g),
-                mean=5,
-                sd=1,
-                seed_frac=s,
-            )
-            int_exp_dist = exponential_threshold_distribution(
-                n=len(g),
-                beta=3,
-                seed_frac=s,
-            )
-            int_unif_dist = uniform_threshold_distribution(
-                n=len(g),
-                min=0,
-                max=11,
-                seed_frac=s,
-            )
-            frac_norm_dist = 0.5 * (int_norm_dist / np.max(int_norm_dist))
-            frac_exp_dist = int_exp_dist / np.max(int_exp_dist)
-            frac_unif_dist = 0.75 * (int_unif_dist / np.max(int_unif_dist))
-            frac_cons_dist = set_seeds(
-                np.zeros((1000,)) + .2,
-                s,
-            )
+    # imported here since the driver builds on this module
+    from cascades_driver import write_runs
 
-            results = [
-                ICMPushModel(
-                    g,
-                    p=p,
-                    s=s,
-                    name='icm_push',
-                ).dynamics(),
-                ICMPullModel(g,
-                    p=p,
-                    s=s,
-                    name='icm_pull',
-                ).dynamics(),
-                IntThresholdModel(g,
-                    int_norm_dist,
-                    name='th_int_norm',
-                ).dynamics(),
-                IntThresholdModel(g,
-                    int_exp_dist,
-                    name='th_int_exp',
-                ).dynamics(),
-                IntThresholdModel(g,
-                    int_unif_dist,
-                    name='th_int_unif',
-                ).dynamics(),
-                FracThresholdModel(g,
-                    frac_norm_dist,
-                    name='th_frac_norm',
-                ).dynamics(),
-                FracThresholdModel(g,
-                    frac_exp_dist,
-                    name='th_frac_exp',
-                ).dynamics(),
-                FracThresholdModel(g,
-                    frac_unif_dist,
-                    name='th_frac_unif',
-                ).dynamics(),
-                FracThresholdModel(g,
-                    frac_cons_dist,
-                    name='th_frac_cons',
-                ).dynamics(),
-            ]
-            for res in results:
-                for elem in res:
-                    w.writerow(elem)
-            print('done with run {}'.format(count))
+    write_runs('/Users/g/Desktop/new_sim_runs.tsv')
@@ -0,0 +1,182 @@
+import csv
+import functools
+import multiprocessing
+import numpy as np
+
+from cascades import set_seeds,\
+                     normal_threhsold_distribution,\
+                     exponential_threshold_distribution,\
+                     uniform_threshold_distribution
+from array_cascades import ArrayICMPushModel, ArrayICMPullModel,\
+                           ArrayIntThresholdModel, ArrayFracThresholdModel
+from graph_generators import barabasi_albert
+
+"""
+Parallel, reproducible driver for the cascades.py models
+
+Each replicate draws one BA graph and runs every model in MODEL_NAMES on it.
+The unit of work is a (replicate, model) task, farmed out to a process pool
+
+Randomness comes from one master seed:
+    SeedSequence(master_seed)
+        -> one child per replicate
+            -> graph seed, threshold seed, one seed per model
+Every task rebuilds its inputs from its own seeds, so output is
+bit-identical for a given master seed no matter how many workers we use.
+Results stream back in task order to a single writer
+
+Functions:
+    - make_tasks
+    - run_task
+    - run_replicates
+    - write_runs
+"""
+
+P = 0.2
+S = 0.05
+GSIZE = 1000
+BA_M = 6
+N_RUNS = 100
+
+FIELDNAMES = [
+    'active',
+    'before_exposure',
+    'exposure_at_activation',
+    'critical_exposure',
+    'threshold',
+    'name',
+]
+
+MODEL_NAMES = [
+    'icm_push',
+    'icm_pull',
+    'th_int_norm',
+    'th_int_exp',
+    'th_int_unif',
+    'th_frac_norm',
+    'th_frac_exp',
+    'th_frac_unif',
+    'th_frac_cons',
+]
+
+#### Task setup ################################################################
+
+def make_tasks(n_runs, master_seed=None):
+    """
+    Outputs:
+        [(run_idx, model_name, graph_seq, thresh_seq, model_seq), ...]
+        ordered by replicate, then by MODEL_NAMES
+    """
+    tasks = []
+    run_seqs = np.random.SeedSequence(master_seed).spawn(n_runs)
+    for run_idx, run_seq in enumerate(run_seqs):
+        graph_seq, thresh_seq, *model_seqs = run_seq.spawn(
+            2 + len(MODEL_NAMES)
+        )
+        for model_name, model_seq in zip(MODEL_NAMES, model_seqs):
+            tasks.append(
+                (run_idx, model_name, graph_seq, thresh_seq, model_seq)
+            )
+    return tasks
+
+@functools.lru_cache(maxsize=4)
+def build_topology(gsize, graph_seed):
+    """
+    A worker usually gets all the models of one replicate in a row,
+    so we only build each graph once per worker
+    """
+    return barabasi_albert(gsize, BA_M, rng=np.random.default_rng(graph_seed))
+
+def threshold_dists(n, s, rng):
+    """
+    All threshold distributions for one replicate
+    """
+    int_norm_dist = normal_threhsold_distribution(
+        n=n,
+        mean=5,
+        sd=1,
+        seed_frac=s,
+        rng=rng,
+    )
+    int_exp_dist = exponential_threshold_distribution(
+        n=n,
+        beta=3,
+        seed_frac=s,
+        rng=rng,
+    )
+    int_unif_dist = uniform_threshold_distribution(
+        n=n,
+        min=0,
+        max=11,
+        seed_frac=s,
+        rng=rng,
+    )
+    return {
+        'th_int_norm': int_norm_dist,
+        'th_int_exp': int_exp_dist,
+        'th_int_unif': int_unif_dist,
+        'th_frac_norm': 0.5 * (int_norm_dist / np.max(int_norm_dist)),
+        'th_frac_exp': int_exp_dist / np.max(int_exp_dist),
+        'th_frac_unif': 0.75 * (int_unif_dist / np.max(int_unif_dist)),
+        'th_frac_cons': set_seeds(np.zeros((n,)) + .2, s, rng=rng),
+    }
+
+#### Running ###################################################################
+
+def run_task(task):
+    """
+    Runs one model on one replicate's graph, returns (run_idx, SimColumns)
+    """
+    run_idx, model_name, graph_seq, thresh_seq, model_seq = task
+    topology = build_topology(GSIZE, int(graph_seq.generate_state(1)[0]))
+    rng = np.random.default_rng(model_seq)
+    if model_name == 'icm_push':
+        model = ArrayICMPushModel(topology, p=P, s=S, name=model_name, rng=rng)
+    elif model_name == 'icm_pull':
+        model = ArrayICMPullModel(topology, p=P, s=S, name=model_name, rng=rng)
+    else:
+        dists = threshold_dists(
+            topology.n,
+            S,
+            np.random.default_rng(thresh_seq),
+        )
+        if model_name.startswith('th_int'):
+            model_class = ArrayIntThresholdModel
+        else:
+            model_class = ArrayFracThresholdModel
+        model = model_class(
+            topology,
+            dists[model_name],
+            name=model_name,
+            rng=rng,
+        )
+    return run_idx, model.dynamics(columnar=True)
+
+def run_replicates(n_runs=N_RUNS, master_seed=None, n_workers=None):
+    """
+    Yields (run_idx, SimColumns) in task order
+
+    n_workers=1 runs in this process, None uses every core
+    """
+    tasks = make_tasks(n_runs, master_seed)
+    if n_workers == 1:
+        for task in tasks:
+            yield run_task(task)
+        return
+    with multiprocessing.Pool(n_workers) as pool:
+        for result in pool.imap(run_task, tasks, chunksize=len(MODEL_NAMES)):
+            yield result
+
+def write_runs(output_path, n_runs=N_RUNS, master_seed=None, n_workers=None):
+    """
+    Writes every node of every model run to one tsv
+    """
+    with open(output_path, 'w') as outfile:
+        w = csv.DictWriter(outfile, fieldnames=FIELDNAMES, delimiter='\t')
+        w.writeheader()
+        results = run_replicates(n_runs, master_seed, n_workers)
+        for run_idx, sim_columns in results:
+            for record in sim_columns.records():
+                w.writerow(record)
+            if sim_columns.name == MODEL_NAMES[-1]:
+                print('done with run {}'.format(run_idx + 1))
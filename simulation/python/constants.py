@@ -4,6 +4,7 @@ We store all the paths here in an orderly fashion
 
 DATA_PATH = '/Users/g/Drive/project-thresholds/thresholds/data/'
 SIM_PATH = DATA_PATH + 'sim.csv'
+SIM_COLUMNAR_PATH = DATA_PATH + 'sim_columnar/'
 SIM_RMSE_DF_PATH = DATA_PATH + 'sim_rmse_df.csv'
 SIM_K_DF_PATH = DATA_PATH + 'sim_k_df.csv'
 EMPIRICAL_PATH = DATA_PATH + 'empirical_replicants/'
@@ -22,3 +23,8 @@ EMPIRICAL_GRAPH_FOLDER = DATA_PATH + 'graphml_graphs/'
 ONE_OFF_DF_PATH = DATA_PATH + 'one_off_df.csv'
 ONE_OFF_IDEAL_DF_PATH = DATA_PATH + 'one_off_ideal_df.csv'
 ONE_OFF_SIM_PATH = DATA_PATH + 'one_off_sim.csv'
+ONE_OFF_TRACE_PATH = DATA_PATH + 'one_off_trace.bin'
+
+GRAPH_POOL_PATH = DATA_PATH + 'graph_pool/'
+RESULT_CACHE_PATH = DATA_PATH + 'result_cache/'
+RESULT_CACHE_BYTES = 20 * 2**30
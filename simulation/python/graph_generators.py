@@ -0,0 +1,265 @@
+import numpy as np
+
+from topology import CSRGraph
+
+"""
+NumPy versions of the NetworkX random graph generators we use
+
+They follow the NetworkX 1.x algorithms step for step in distribution, so
+degree and clustering statistics match, but return a CSRGraph with nodes
+0..n-1 and never build a NetworkX graph
+
+    watts_strogatz: ring lattice as arrays, every rewire drawn at once, with
+        rounds of redraws for self loops and multi-edges. nx rewires edge by
+        edge, so the rules match but not the exact process
+    barabasi_albert: the repeated-nodes list is never materialized. A draw
+        from it either hits a copy of a source node, which we know directly,
+        or an earlier node's target. Rows are drawn in doubling chunks, all
+        rows of a chunk at once
+    holme_kim: the triad step needs the graph as built so far, so this one
+        walks the nodes in order, but over plain lists instead of a
+        NetworkX graph
+
+Functions:
+    - watts_strogatz
+    - barabasi_albert
+    - holme_kim
+"""
+
+def edge_key(u, v, n):
+    """
+    One int per undirected edge
+    """
+    return np.minimum(u, v) * n + np.maximum(u, v)
+
+def in_sorted(sorted_keys, keys):
+    """
+    Whether each of keys is in sorted_keys
+    """
+    if len(sorted_keys) == 0:
+        return np.zeros(len(keys), dtype=bool)
+    pos = np.searchsorted(sorted_keys, keys)
+    return sorted_keys[np.minimum(pos, len(sorted_keys) - 1)] == keys
+
+#### Small world ###############################################################
+
+def watts_strogatz(n, k, p, rng=None):
+    """
+    - inputs
+        n: nodes
+        k: each node starts linked to its k // 2 nearest neighbors each side
+        p: probability each lattice edge is rewired
+
+    A rewired edge (u, v) becomes (u, w) for w uniform, redrawn while w == u
+    or (u, w) is already an edge, and u linked to every other node keeps
+    (u, v), as in nx.watts_strogatz_graph. Edges not yet rewired count as
+    edges, but nx rewires one edge at a time and we check a round of draws
+    against the edges as they were before the round
+    """
+    if k >= n:
+        raise ValueError('k>=n, choose smaller k or larger n')
+    if rng is None:
+        rng = np.random.default_rng()
+    half = k // 2
+    src = np.repeat(np.arange(n), half)
+    dst = (src + np.tile(np.arange(1, half + 1), n)) % n
+
+    rewire = rng.random(len(src)) < p
+    todo = np.flatnonzero(rewire)
+    # every current edge, rewired or not
+    taken = np.sort(edge_key(src, dst, n))
+    while len(todo) > 0:
+        degree = np.bincount(
+            np.concatenate([taken // n, taken % n]),
+            minlength=n,
+        )
+        # no w left for u, skip this rewiring
+        todo = todo[degree[src[todo]] < n - 1]
+        if len(todo) == 0:
+            break
+        cand = rng.integers(0, n, len(todo))
+        keys = edge_key(src[todo], cand, n)
+        ok = (cand != src[todo]) & ~in_sorted(taken, keys)
+        # two rewires landing on the same new edge, first one wins
+        first = np.zeros(len(todo), dtype=bool)
+        first[np.unique(keys, return_index=True)[1]] = True
+        ok &= first
+        moved = edge_key(src[todo[ok]], dst[todo[ok]], n)
+        dst[todo[ok]] = cand[ok]
+        taken = np.sort(np.concatenate([
+            np.setdiff1d(taken, moved, assume_unique=True),
+            keys[ok],
+        ]))
+        todo = todo[~ok]
+    return CSRGraph.from_edges(n, src, dst)
+
+#### Preferential attachment ###################################################
+
+def barabasi_albert(n, m, rng=None):
+    """
+    - inputs
+        n: nodes
+        m: edges from each new node
+
+    As in nx.barabasi_albert_graph, node m links to nodes 0..m-1, and node
+    m + i links to the first m distinct draws from the repeated-nodes list
+    of the first i nodes, 2m entries per node:
+        its m targets, then m copies of itself
+    A draw at r in [0, 2mi) lands in block b = r // 2m at offset o = r % 2m
+        o >= m: the copy of node m + b
+        o < m: the o-th target of node m + b
+
+    Rows go in chunks [start, 2 * start), so draws from before the chunk
+    read finished targets, see attach_chunk
+    """
+    if m < 1 or m >= n:
+        raise ValueError('need 1 <= m < n, m={}, n={}'.format(m, n))
+    if rng is None:
+        rng = np.random.default_rng()
+    n_rows = n - m
+    targets = np.empty((n_rows, m), dtype=np.int64)
+    targets[0] = np.arange(m)
+    start = 1
+    while start < n_rows:
+        stop = min(n_rows, 2 * start)
+        targets[start:stop] = attach_chunk(targets, start, stop, m, rng)
+        start = stop
+    src = np.repeat(np.arange(m, n), m)
+    return CSRGraph.from_edges(n, src, targets.ravel())
+
+def attach_chunk(targets, start, stop, m, rng):
+    """
+    Targets for rows start..stop - 1, given finished rows before start
+
+    Each row draws a few spare candidates up front. Draws that point into
+    the chunk itself are solved by fixed point iteration: pointers only go
+    to earlier rows, so the iteration settles on the unique solution. Each
+    round only revisits rows that point at a row that just changed, and a
+    row that runs out of candidates gets another column
+    """
+    rows = np.arange(start, stop)
+    flat_targets = targets.reshape(-1)
+
+    def more_columns(n_cols):
+        r = rng.random((len(rows), n_cols)) * (2 * m * rows[:, None])
+        b, o = np.divmod(r.astype(np.int64), 2 * m)
+        # direct draws keep the node id in pointer
+        return o >= m, np.where(o >= m, m + b, b * m + o)
+
+    def inside_arcs():
+        """
+        (row, row it points to) for draws into the chunk, chunk-relative
+        """
+        row, col = np.nonzero(~direct & (pointer >= start * m))
+        return row, (pointer[row, col] - start * m) // m
+
+    direct, pointer = more_columns(m + 2)
+    dep_row, dep_on = inside_arcs()
+    chunk_targets = np.full((len(rows), m), -1, dtype=np.int64)
+    flat_chunk = chunk_targets.reshape(-1)
+    dirty = np.arange(len(rows))
+    while len(dirty) > 0:
+        dirty_direct = direct[dirty]
+        dirty_pointer = pointer[dirty]
+        inside = ~dirty_direct & (dirty_pointer >= start * m)
+        before = ~dirty_direct & ~inside
+        values = np.where(dirty_direct, dirty_pointer, -1)
+        values[before] = flat_targets[dirty_pointer[before]]
+        values[inside] = flat_chunk[dirty_pointer[inside] - start * m]
+        new_targets = first_distinct(values, m)
+        changed = np.zeros(len(rows), dtype=bool)
+        changed[dirty] = (new_targets != chunk_targets[dirty]).any(axis=1)
+        chunk_targets[dirty] = new_targets
+        # short rows with nothing unknown need more candidates
+        short = dirty[(new_targets < 0).any(axis=1) & (values >= 0).all(axis=1)]
+        if len(short) > 0:
+            new_direct, new_pointer = more_columns(1)
+            direct = np.hstack([direct, new_direct])
+            pointer = np.hstack([pointer, new_pointer])
+            dep_row, dep_on = inside_arcs()
+        dirty = np.union1d(dep_row[changed[dep_on]], short)
+    return chunk_targets
+
+def first_distinct(values, m):
+    """
+    First m distinct values of each row, in order
+    An unknown value (-1) hides everything after it, -1 pads short rows
+    """
+    order = np.argsort(values, axis=1, kind='stable')
+    sorted_values = np.take_along_axis(values, order, axis=1)
+    first_sorted = np.ones(values.shape, dtype=bool)
+    first_sorted[:, 1:] = sorted_values[:, 1:] != sorted_values[:, :-1]
+    is_first = np.empty(values.shape, dtype=bool)
+    np.put_along_axis(is_first, order, first_sorted, axis=1)
+    keep = is_first & (np.cumsum(values < 0, axis=1) == 0)
+    rank = np.cumsum(keep, axis=1)
+    keep &= rank <= m
+    out = np.full((len(values), m), -1, dtype=np.int64)
+    row, col = np.nonzero(keep)
+    out[row, rank[row, col] - 1] = values[row, col]
+    return out
+
+def uniform_stream(rng, chunk=1 << 16):
+    """
+    Yields uniform floats, drawn from numpy a chunk at a time
+    """
+    while True:
+        for u in rng.random(chunk).tolist():
+            yield u
+
+def holme_kim(n, m, p, rng=None):
+    """
+    - inputs
+        n: nodes
+        m: edges from each new node
+        p: probability of a triad step after each edge
+
+    Same procedure as nx.powerlaw_cluster_graph, including its quirks: the
+    triad target is the last preferential target, and a preferential target
+    already linked by a triad step adds no edge but still counts
+    """
+    if m < 1 or m >= n:
+        raise ValueError('need 1 <= m < n, m={}, n={}'.format(m, n))
+    if rng is None:
+        rng = np.random.default_rng()
+    uniform = uniform_stream(rng)
+    repeated = list(range(m))
+    adj = [[] for _ in range(n)]
+    src = []
+    dst = []
+    for source in range(m, n):
+        possible_targets = set()
+        while len(possible_targets) < m:
+            possible_targets.add(
+                repeated[int(next(uniform) * len(repeated))]
+            )
+        linked = set()
+        source_adj = adj[source]
+        def link(node):
+            if node not in linked:
+                linked.add(node)
+                source_adj.append(node)
+                adj[node].append(source)
+                src.append(source)
+                dst.append(node)
+            repeated.append(node)
+        target = possible_targets.pop()
+        link(target)
+        count = 1
+        while count < m:
+            if next(uniform) < p:
+                neighborhood = [
+                    nbr for nbr in adj[target]
+                    if nbr not in linked and nbr != source
+                ]
+                if neighborhood:
+                    link(
+                        neighborhood[int(next(uniform) * len(neighborhood))]
+                    )
+                    count += 1
+                    continue
+            target = possible_targets.pop()
+            link(target)
+            count += 1
+        repeated.extend([source] * m)
+    return CSRGraph.from_edges(n, src, dst)
@@ -0,0 +1,157 @@
+import collections
+import hashlib
+import os
+import numpy as np
+
+from constants import *
+from graph_generators import watts_strogatz, holme_kim
+from topology import CSRGraph, as_topology
+
+"""
+A pool of generated graphs shared across threshold equations
+
+The sweep runs every threshold equation on the same grid of graph cells
+(graph type, size, mean degree, rewire/cluster prob) with N_REPS replicates
+each. The pool gives replicate k of a cell the same topology for every
+equation:
+    - built once, from a seed derived from the cell and k
+    - saved as a CSRGraph .npz under the pool folder
+    - kept in a small in-memory LRU while it is hot
+
+So generation is paid once per (cell, k) instead of once per equation, and
+equations are compared on identical graphs (common random numbers)
+
+Keys look like ('ws', graph_size, mean_deg, rewire_prob, k, version), where
+version is the generator's entry in GRAPH_GENERATOR_VERSIONS. It is part of
+the seed and the file name, so graphs from an older generator are never
+loaded in place of new ones
+
+Classes:
+    - GraphPool
+
+Functions:
+    - graph_seed
+"""
+
+def generate_ws(graph_size, mean_deg, rewire_prob, seed):
+    return watts_strogatz(
+        graph_size,
+        mean_deg,
+        rewire_prob,
+        rng=np.random.default_rng(seed),
+    )
+
+def generate_plc(graph_size, mean_deg, cluster_prob, seed):
+    return holme_kim(
+        graph_size,
+        int(mean_deg/2.),
+        cluster_prob,
+        rng=np.random.default_rng(seed),
+    )
+
+# graph_type -> f(graph_size, mean_deg, prob, seed) -> CSRGraph or nx graph
+GRAPH_GENERATORS = {
+    'ws': generate_ws,
+    'plc': generate_plc,
+}
+# bump when a generator's output changes, pooled graphs and cached runs are
+# keyed on this
+GRAPH_GENERATOR_VERSIONS = {
+    'ws': 2,
+    'plc': 2,
+}
+
+def graph_seed(key):
+    """
+    32 bit seed from the key, the same in every process and session
+    """
+    digest = hashlib.sha1(repr(key).encode()).digest()
+    return int.from_bytes(digest[:4], 'little')
+
+class GraphPool(object):
+    """
+    - inputs
+        path: folder for the .npz files, None keeps graphs in memory only
+        generators: graph_type -> generator, see GRAPH_GENERATORS
+        cache_size: graphs held in memory
+        versions: graph_type -> generator version, see
+            GRAPH_GENERATOR_VERSIONS
+    """
+    def __init__(
+        self,
+        path=GRAPH_POOL_PATH,
+        generators=None,
+        cache_size=64,
+        versions=None,
+        ):
+        self.path = path
+        if generators is None:
+            generators = GRAPH_GENERATORS
+        if versions is None:
+            versions = GRAPH_GENERATOR_VERSIONS
+        self.generators = generators
+        self.versions = versions
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        if self.path is not None:
+            os.makedirs(self.path, exist_ok=True)
+
+    def graph_path(self, key):
+        graph_type, graph_size, mean_deg, prob, rep, version = key
+        fname = '{}_n{}_md{}_p{}_rep{}_v{}.npz'.format(
+            graph_type,
+            graph_size,
+            mean_deg,
+            prob,
+            rep,
+            version,
+        )
+        return os.path.join(self.path, fname)
+
+    def get_topology(self, graph_type, graph_size, mean_deg, prob, rep):
+        """
+        CSRGraph for replicate rep of this cell, built on first request
+        """
+        key = (
+            graph_type,
+            graph_size,
+            mean_deg,
+            prob,
+            rep,
+            self.versions[graph_type],
+        )
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        if self.path is not None and os.path.exists(self.graph_path(key)):
+            topology = CSRGraph.load(self.graph_path(key))
+        else:
+            topology = self.build(key)
+            if self.path is not None:
+                topology.save(self.graph_path(key))
+        self.cache[key] = topology
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return topology
+
+    def get_graph(self, graph_type, graph_size, mean_deg, prob, rep):
+        """
+        A fresh NetworkX copy, safe for the simulation to label
+        """
+        return self.get_topology(
+            graph_type,
+            graph_size,
+            mean_deg,
+            prob,
+            rep,
+        ).to_networkx()
+
+    def build(self, key):
+        graph_type, graph_size, mean_deg, prob, rep, _ = key
+        g = self.generators[graph_type](
+            graph_size,
+            mean_deg,
+            prob,
+            graph_seed(key),
+        )
+        return as_topology(g)
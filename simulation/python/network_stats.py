@@ -0,0 +1,282 @@
+import collections
+import numpy as np
+import scipy.sparse.csgraph as csgraph
+
+from topology import CSRGraph, as_topology
+
+"""
+Node-level network statistics, computed once per graph
+
+The sweeps run many replicates on each graph, so every centrality is cached
+under a fingerprint of the graph's CSR arrays. Two graphs with the same
+nodes and edges (in the same node order) share their statistics, whatever
+object they live in. Degree is cheaper to read off the graph than to look
+up, so it skips the cache.
+
+Everything is array-based on top of a CSRGraph:
+    pagerank, evcent: sparse power iteration
+    closeness, betweenness: batched BFS from a set of pivot nodes
+        pivots=None uses every node and is exact
+        pivots=k samples k nodes and scales up, error shrinks like 1/sqrt(k)
+
+Values match NetworkX's normalized defaults (degree_centrality,
+closeness_centrality, betweenness_centrality, pagerank,
+eigenvector_centrality)
+
+Functions:
+    - graph_fingerprint
+    - node_stats
+    - degree_centrality
+    - pagerank
+    - eigenvector_centrality
+    - closeness_centrality
+    - betweenness_centrality
+"""
+
+NETWORK_STATS = ['closeness', 'betweenness', 'pagerank', 'evcent']
+
+# fingerprint -> {stat key: array}, least recently used graph goes first
+STATS_CACHE_SIZE = 32
+_STATS_CACHE = collections.OrderedDict()
+
+# rows of the pivot-by-node distance matrix we hold at once
+PIVOT_BATCH = 256
+
+#### Cache #####################################################################
+
+def graph_fingerprint(topology):
+    """
+    sha1 of the node labels and CSR arrays, see CSRGraph.fingerprint
+    """
+    return topology.fingerprint()
+
+def node_stats(graph, stats=NETWORK_STATS, pivots=None, seed=0, topology=None):
+    """
+    Inputs:
+        graph: NetworkX graph or CSRGraph
+        stats: names from NETWORK_STATS, plus 'degree'
+        pivots: None for exact closeness/betweenness, else the number of
+            sampled pivot nodes
+        seed: pivot sampling seed, so sampled values are cacheable too
+        topology: graph as a CSRGraph, if the caller has one already
+
+    Outputs:
+        nodes, {stat: array aligned with nodes}
+        arrays are read-only and shared between callers
+
+    Degree is read straight off the graph. Only the centralities go through
+    the cache, which needs a CSRGraph and its fingerprint
+    """
+    cached_stats = [stat for stat in stats if stat != 'degree']
+    if topology is None and (cached_stats or isinstance(graph, CSRGraph)):
+        topology = as_topology(graph)
+    out = {}
+    if topology is None:
+        nodes = np.asarray(graph.nodes())
+        if 'degree' in stats:
+            out['degree'] = degree_centrality(graph)
+    else:
+        nodes = topology.nodes
+        if 'degree' in stats:
+            out['degree'] = degree_centrality(topology)
+    if cached_stats:
+        out.update(cached_node_stats(topology, cached_stats, pivots, seed))
+    return nodes, {stat: out[stat] for stat in stats}
+
+def cached_node_stats(topology, stats, pivots, seed):
+    """
+    node_stats for the centralities, from the cache when we've seen the
+    graph before
+    """
+    key = graph_fingerprint(topology)
+    if key in _STATS_CACHE:
+        _STATS_CACHE.move_to_end(key)
+    else:
+        _STATS_CACHE[key] = {}
+        if len(_STATS_CACHE) > STATS_CACHE_SIZE:
+            _STATS_CACHE.popitem(last=False)
+    cached = _STATS_CACHE[key]
+
+    out = {}
+    for stat in stats:
+        if stat in ['closeness', 'betweenness'] and pivots is not None:
+            stat_key = (stat, pivots, seed)
+        else:
+            stat_key = stat
+        if stat_key not in cached:
+            if stat == 'pagerank':
+                val = pagerank(topology)
+            elif stat == 'evcent':
+                val = eigenvector_centrality(topology)
+            elif stat == 'closeness':
+                val = closeness_centrality(topology, pivots, seed)
+            elif stat == 'betweenness':
+                val = betweenness_centrality(topology, pivots, seed)
+            else:
+                raise ValueError('Unknown network stat {}'.format(stat))
+            val.setflags(write=False)
+            cached[stat_key] = val
+        out[stat] = cached[stat_key]
+    return out
+
+#### Spectral ##################################################################
+
+def degree_centrality(graph):
+    """
+    graph: CSRGraph, or a NetworkX graph, read as is in graph.nodes() order
+    """
+    if isinstance(graph, CSRGraph):
+        n = graph.n
+        degree = graph.degree
+    else:
+        nodes = graph.nodes()
+        n = len(nodes)
+        node_degree = graph.degree()
+        degree = np.array([node_degree[node] for node in nodes], dtype=float)
+    if n <= 1:
+        return np.ones(n)
+    return degree / (n - 1.)
+
+def pagerank(topology, alpha=0.85, max_iter=100, tol=1e-6):
+    """
+    Power iteration on the sparse transition matrix
+    Dangling nodes spread their rank uniformly, as in NetworkX
+    """
+    n = topology.n
+    if n == 0:
+        return np.zeros(0)
+    out_deg = topology.degree.astype(float)
+    dangling = out_deg == 0
+    inv_deg = np.where(dangling, 0., 1. / np.maximum(out_deg, 1.))
+    # adjacency is symmetric, so A.dot(x / deg) pulls rank from in-neighbors
+    adj = topology.adjacency()
+    x = np.full(n, 1. / n)
+    for _ in range(max_iter):
+        x_last = x
+        x = alpha * adj.dot(x_last * inv_deg)
+        x += (alpha * x_last[dangling].sum() + 1. - alpha) / n
+        if np.abs(x - x_last).sum() < n * tol:
+            return x
+    raise RuntimeError(
+        'pagerank failed to converge in {} iterations'.format(max_iter)
+    )
+
+def eigenvector_centrality(topology, max_iter=100, tol=1e-6):
+    """
+    Power iteration on A + I, which has the same leading eigenvector as A
+    but doesn't oscillate on bipartite graphs. Unit L2 norm, as in NetworkX
+    """
+    n = topology.n
+    if n == 0:
+        return np.zeros(0)
+    adj = topology.adjacency()
+    x = np.full(n, 1. / n)
+    for _ in range(max_iter):
+        x_last = x
+        x = x_last + adj.dot(x_last)
+        norm = np.linalg.norm(x)
+        if norm == 0:
+            return x
+        x /= norm
+        if np.abs(x - x_last).sum() < n * tol:
+            return x
+    raise RuntimeError(
+        'eigenvector centrality failed to converge in {} iterations'.format(
+            max_iter
+        )
+    )
+
+#### Path-based ################################################################
+
+def pick_pivots(topology, pivots, seed):
+    """
+    Every node if pivots is None or covers the graph, else a sample
+    """
+    if pivots is None or pivots >= topology.n:
+        return np.arange(topology.n)
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(topology.n, pivots, replace=False))
+
+def pivot_distances(topology, sources):
+    """
+    Yields (batch of sources, BFS hop distances from each of them)
+    Unreachable nodes are at distance inf
+    """
+    adj = topology.adjacency()
+    for start in range(0, len(sources), PIVOT_BATCH):
+        batch = sources[start:start + PIVOT_BATCH]
+        dist = csgraph.shortest_path(
+            adj,
+            directed=False,
+            unweighted=True,
+            indices=batch,
+        )
+        yield batch, dist
+
+def closeness_centrality(topology, pivots=None, seed=0):
+    """
+    NetworkX's closeness (with the Wasserman-Faust correction for
+    disconnected graphs)
+
+    The graph is undirected, so d(pivot, v) = d(v, pivot). With sampled
+    pivots we estimate each node's distance sum and reachable count from the
+    pivots and scale by n / k
+    """
+    n = topology.n
+    if n <= 1:
+        return np.zeros(n)
+    sources = pick_pivots(topology, pivots, seed)
+    dist_sum = np.zeros(n)
+    reach = np.zeros(n)
+    for _, dist in pivot_distances(topology, sources):
+        finite = np.isfinite(dist)
+        dist_sum += np.where(finite, dist, 0.).sum(axis=0)
+        reach += finite.sum(axis=0)
+    scale = n / float(len(sources))
+    dist_sum *= scale
+    reach *= scale
+    others = reach - 1
+    closeness = np.zeros(n)
+    ok = dist_sum > 0
+    closeness[ok] = (others[ok] / dist_sum[ok]) * (others[ok] / (n - 1.))
+    return closeness
+
+def betweenness_centrality(topology, pivots=None, seed=0):
+    """
+    Brandes' algorithm, run for a batch of sources at once
+    Shortest path counts go forward level by level, dependencies come back,
+    each level step is one sparse product over the whole batch
+
+    Normalized like NetworkX, sampled pivots are scaled by n / k
+    """
+    n = topology.n
+    if n <= 2:
+        return np.zeros(n)
+    adj = topology.adjacency().astype(float)
+    sources = pick_pivots(topology, pivots, seed)
+    betweenness = np.zeros(n)
+    for batch, dist in pivot_distances(topology, sources):
+        dist[~np.isfinite(dist)] = -1
+        max_level = int(dist.max())
+        levels = [dist == level for level in range(max_level + 1)]
+        # number of shortest paths from each source
+        sigma = np.zeros(dist.shape)
+        sigma[levels[0]] = 1.
+        for level in range(1, max_level + 1):
+            sigma_prev = np.where(levels[level - 1], sigma, 0.)
+            step = adj.dot(sigma_prev.T).T
+            sigma[levels[level]] = step[levels[level]]
+        # dependency of each source on each node
+        delta = np.zeros(dist.shape)
+        for level in range(max_level, 0, -1):
+            in_level = levels[level]
+            coeff = np.zeros(dist.shape)
+            coeff[in_level] = (1. + delta[in_level]) / sigma[in_level]
+            pulled = adj.dot(coeff.T).T
+            in_prev = levels[level - 1]
+            delta[in_prev] = sigma[in_prev] * pulled[in_prev]
+        delta[np.arange(len(batch)), batch] = 0.
+        betweenness += delta.sum(axis=0)
+    scale = 1. / ((n - 1.) * (n - 2.))
+    scale *= n / float(len(sources))
+    return betweenness * scale
@@ -0,0 +1,67 @@
+import numpy as np
+
+"""
+Random visiting orders without per-epoch set -> list conversions
+
+Classes:
+    - ShuffledIndex
+"""
+
+class ShuffledIndex(object):
+    """
+    - inputs
+        n: number of nodes, ids are 0..n-1
+        members: ids initially in the index, defaults to all of them
+
+    Members live in a preallocated buffer:
+        buf[:size] are the members in their current order
+        pos[i] is the slot of id i in buf, -1 if i is not a member
+
+    shuffle reorders buf[:size] in place (numpy's Fisher-Yates) and remove
+    swaps the last member into the freed slot, so nothing is reallocated
+    after construction
+
+    Removing the member at slot k moves buf[size - 1] into slot k. If you are
+    walking the buffer and remove the member you are standing on, don't
+    advance: the node moved in hasn't been visited yet, and the unvisited
+    nodes are still in uniformly random order
+    """
+    def __init__(self, n, members=None):
+        if members is None:
+            members = np.arange(n)
+        self.size = len(members)
+        self.buf = np.empty(n, dtype=np.int64)
+        self.buf[:self.size] = members
+        self.pos = np.full(n, -1, dtype=np.int64)
+        self.pos[self.buf[:self.size]] = np.arange(self.size)
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, idx):
+        return self.pos[idx] >= 0
+
+    def view(self):
+        """
+        Current members in order, a view that the next shuffle or remove
+        will change
+        """
+        return self.buf[:self.size]
+
+    def shuffle(self, rng):
+        members = self.buf[:self.size]
+        rng.shuffle(members)
+        self.pos[members] = np.arange(self.size)
+
+    def remove(self, idx):
+        slot = self.pos[idx]
+        last = self.buf[self.size - 1]
+        self.buf[slot] = last
+        self.pos[last] = slot
+        self.buf[self.size - 1] = idx
+        self.pos[idx] = -1
+        self.size -= 1
+
+    def remove_many(self, idxs):
+        for idx in idxs:
+            self.remove(idx)
@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+
+from sim_store import write_shard, read_run_columns
+
+"""
+Content-addressed cache of finished simulation runs
+
+A run is fully determined by its spec:
+    {'equation': {...}, 'graph_type': str, 'graph_size': int,
+     'mean_deg': int, 'prob': float, 'rep': int,
+     'engine': str, 'engine_version': int, 'graph_version': int}
+rep picks the graph from the graph pool and, with the rest of the spec,
+the run's seed. The run id is a hash of the spec and goes in the
+rand_string column, so rerunning a configuration gives the same id and the
+same records
+
+Cached runs are one-run shards, <run id>.npz, in the cache folder. A hit
+touches the file, and when the folder grows past max_bytes the least
+recently used runs are deleted. Several processes can share a folder: writes
+are atomic and eviction tolerates files that are already gone
+
+Classes:
+    - ResultCache
+
+Functions:
+    - run_id
+    - run_seed
+"""
+
+# evict down to this fraction of max_bytes
+EVICT_TO = 0.9
+
+def spec_digest(spec):
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).digest()
+
+def run_id(spec):
+    return spec_digest(spec).hex()[:16]
+
+def run_seed(spec):
+    """
+    int seed for np.random.default_rng / SeedSequence
+    """
+    return int.from_bytes(spec_digest(spec), 'little')
+
+class ResultCache(object):
+    """
+    - inputs
+        path: cache folder
+        max_bytes: size bound for the folder
+    """
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+        self.approx_bytes = self.scan_bytes()
+
+    def run_path(self, run_id):
+        return os.path.join(self.path, '{}.npz'.format(run_id))
+
+    def get(self, run_id):
+        """
+        RunColumns for a cached run, None on a miss
+        """
+        path = self.run_path(run_id)
+        try:
+            run = read_run_columns(path)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return run
+
+    def put(self, run_id, run):
+        """
+        run: RunColumns or list_of_record_dicts
+        """
+        path = self.run_path(run_id)
+        write_shard(path, [run])
+        self.approx_bytes += os.path.getsize(path)
+        if self.approx_bytes > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """
+        [(last use, size, path), ...] oldest first
+        """
+        entries = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith('.npz'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def scan_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """
+        Deletes least recently used runs down to EVICT_TO * max_bytes
+        Other processes may be adding and evicting too, so we rescan
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= EVICT_TO * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        self.approx_bytes = total
@@ -9,7 +9,8 @@ Due to legacy terminology, "observed" here means "correctly measured"
 
 Input:
 
-sim.csv
+sim.csv, or the same columns split into a runs table and node shards by
+sim_store.ColumnarSimWriter (see yield_columnar_sim_records)
     activated
     activation_order
     after_activation_alters
@@ -94,7 +95,9 @@ import csv
 import sys
 import math
 import itertools
+import numpy as np
 import pandas as pd
+import sim_store
 from math import sqrt
 from sklearn import linear_model
 from sklearn.metrics import mean_squared_error
@@ -112,6 +115,22 @@ def yield_sim_records():
             params = get_sim_params(df_sim)
             yield df_sim, params
 
+def yield_columnar_sim_records(output_dir=SIM_COLUMNAR_PATH):
+    """
+    Same as yield_sim_records, reading ColumnarSimWriter output
+    Run columns a run doesn't have come back as NaN, like blank csv cells
+    """
+    runs_path = os.path.join(output_dir, sim_store.RUNS_TABLE)
+    run_cols = [
+        col for col in pd.read_csv(runs_path, nrows=0).columns
+        if col not in ['shard', 'run']
+    ]
+    records = sim_store.yield_columnar_sim_records(output_dir)
+    for df_sim, _ in records:
+        missing = {col: np.nan for col in run_cols if col not in df_sim}
+        df_sim = df_sim.assign(**missing)
+        yield df_sim, get_sim_params(df_sim)
+
 def get_sim_params(df_sim):
     sim_param_cols = [
         'cluster_prob',
@@ -416,7 +435,7 @@ if __name__ == '__main__':
     with open(COUNT_DF_PATH, 'w') as f:
         writer = None
 
-        for df_sim, sim_params in yield_sim_records():
+        for df_sim, sim_params in yield_columnar_sim_records():
             if bail_out(df_sim):
                 counter += 1
                 continue
@@ -0,0 +1,155 @@
+import csv
+import glob
+import os
+import numpy as np
+import pandas as pd
+
+from sim_store import MISSING, stored_column, stored_param
+
+"""
+Per-run aggregates, for sweeps that don't need node records
+
+Most analyses of a sweep only look at a few numbers per run. summarize_run
+computes them straight from a run's node columns (a RunColumns, see
+sim_store) and returns one flat record: the run's params plus one column
+per aggregate, a few hundred bytes instead of a row per node. Columns and
+params are read as a shard stores them (float32 columns, float params), so
+a run summarizes the same fresh or from the result cache
+
+Summary runs (run_sim and friends with summaries set) only build the node
+columns the aggregates read: the sampled thresholds and covariates,
+activated, and before/after_activation_alters for observed
+
+SUMMARIES maps a name to f(columns) -> value, or {column suffix: value} for
+aggregates that fill several columns (written as <name>_<suffix>). Add an
+entry to make a new aggregate selectable from run_sim and the sweep
+
+Summary tables are plain csv: one summary_<task id>.csv per sweep task,
+merged into summaries.csv at the end of the sweep
+
+Functions:
+    - summarize_run
+    - write_summaries
+    - rebuild_summary_table
+"""
+
+# exposure at activation minus threshold, bins [0, 1), ..., [9, inf)
+ERROR_BINS = 10
+
+SUMMARY_GLOB = 'summary_*.csv'
+SUMMARY_TABLE = 'summaries.csv'
+
+#### Aggregates ################################################################
+
+def activated_mask(columns):
+    return columns['activated'] == 1
+
+def cascade_size(columns):
+    return int(np.count_nonzero(activated_mask(columns)))
+
+def cascade_frac(columns):
+    return cascade_size(columns) / float(len(columns['activated']))
+
+def n_observed(columns):
+    return int(np.count_nonzero(columns['observed'] == 1))
+
+def mean_epsilon_activated(columns):
+    """
+    None without an epsilon column or with no activations
+    """
+    if 'epsilon' not in columns:
+        return None
+    epsilon = columns['epsilon'][activated_mask(columns)]
+    if len(epsilon) == 0:
+        return None
+    return float(epsilon.mean())
+
+def threshold_error(columns):
+    after = columns['after_activation_alters']
+    has_after = activated_mask(columns) & (after != MISSING)
+    return after[has_after].astype(float) - columns['threshold'][has_after]
+
+def mean_threshold_error(columns):
+    """
+    Mean of exposure at activation minus threshold over activated nodes
+    """
+    error = threshold_error(columns)
+    if len(error) == 0:
+        return None
+    return float(error.mean())
+
+def threshold_error_hist(columns):
+    """
+    Counts of exposure at activation minus threshold, binned by ERROR_BINS
+    """
+    error = threshold_error(columns)
+    bins = np.clip(np.floor(error), 0, ERROR_BINS - 1).astype(np.int64)
+    counts = np.bincount(bins, minlength=ERROR_BINS)
+    return {str(b): int(count) for b, count in enumerate(counts)}
+
+SUMMARIES = {
+    'cascade_size': cascade_size,
+    'cascade_frac': cascade_frac,
+    'n_observed': n_observed,
+    'mean_epsilon_activated': mean_epsilon_activated,
+    'mean_threshold_error': mean_threshold_error,
+    'threshold_error_hist': threshold_error_hist,
+}
+DEFAULT_SUMMARIES = sorted(SUMMARIES)
+
+def summarize_run(run, summaries=None):
+    """
+    Inputs:
+        run: RunColumns
+        summaries: names from SUMMARIES, None for DEFAULT_SUMMARIES
+
+    Outputs:
+        {param: value, ..., summary col: value, ...}
+    """
+    if summaries is None:
+        summaries = DEFAULT_SUMMARIES
+    # as a cached run reads back, so a hit and a miss summarize alike
+    columns = {col: stored_column(arr) for col, arr in run.columns.items()}
+    record = {col: stored_param(val) for col, val in run.params.items()}
+    for name in summaries:
+        value = SUMMARIES[name](columns)
+        if isinstance(value, dict):
+            for suffix, val in value.items():
+                record['{}_{}'.format(name, suffix)] = val
+        else:
+            record[name] = value
+    return record
+
+#### Tables ####################################################################
+
+def write_summaries(path, records):
+    """
+    Writes summary records as csv, atomically
+    """
+    cols = sorted(set(col for record in records for col in record))
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        w = csv.DictWriter(f, fieldnames=cols)
+        w.writeheader()
+        for record in records:
+            w.writerow(record)
+    os.replace(tmp_path, path)
+
+def rebuild_summary_table(output_dir, tables=None):
+    """
+    Merges every summary_<task id>.csv into summaries.csv
+    tables: file names to include, None for every one in the folder
+    """
+    if tables is None:
+        paths = sorted(glob.glob(os.path.join(output_dir, SUMMARY_GLOB)))
+    else:
+        paths = [os.path.join(output_dir, table) for table in sorted(tables)]
+    df = pd.concat(
+        [pd.read_csv(path) for path in paths],
+        ignore_index=True,
+        sort=True,
+    ) if paths else pd.DataFrame()
+    table_path = os.path.join(output_dir, SUMMARY_TABLE)
+    tmp_path = '{}.{}.tmp'.format(table_path, os.getpid())
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, table_path)
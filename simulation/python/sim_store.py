@@ -0,0 +1,429 @@
+import csv
+import glob
+import os
+import numpy as np
+import pandas as pd
+
+"""
+Columnar storage for simulation output
+
+sim.csv repeats every run-level parameter on every node row. Here a run's
+parameters are stored once and the node columns are typed arrays:
+
+    output_dir/
+        runs.csv            one row per run: shard, run, rand_string, params
+        nodes_00000.npz     compressed node columns for a batch of runs
+        nodes_00001.npz
+        ...
+
+Each shard is self-contained. Besides the node columns it holds
+    'run': int32, which run of the shard each node row belongs to
+    'run:<col>': one entry per run for every run-level column
+so a shard can be read without runs.csv, which is just the small index for
+querying parameters
+
+Node columns are int8/int32 where we know them to be ints (None is
+stored as MISSING) and float32 otherwise. Shards are written to a temp file
+and renamed, so a shard on disk is always complete
+
+In memory a run is a RunColumns: the same typed node columns (floats stay
+float64 until written) plus a dict of its run-level parameters
+
+Classes:
+    - RunColumns
+    - ColumnarSimWriter
+
+Functions:
+    - write_shard
+    - rebuild_runs_table
+    - load_shard
+    - read_shard
+    - read_run_columns
+    - yield_shard_runs
+    - yield_columnar_sim_records
+"""
+
+# node columns with a known int type, everything else numeric is float32
+NODE_COL_DTYPES = {
+    'activated': np.int8,
+    'observed': np.int8,
+    # exposure counts are bounded by degree, which passes int16 on big graphs
+    'before_activation_alters': np.int32,
+    'after_activation_alters': np.int32,
+    'activation_order': np.int32,
+    'node': np.int32,
+}
+# stands in for None in int node columns
+MISSING = -1
+
+# run-level columns: these plus every <var>_dist_<mean|sd|coef>
+RUN_PARAM_COLS = [
+    'rand_string',
+    'graph_type',
+    'mean_deg',
+    'graph_size',
+    'rewire_prob',
+    'cluster_prob',
+]
+DIST_SUFFIXES = ('_dist_mean', '_dist_sd', '_dist_coef')
+
+RUN_PREFIX = 'run:'
+RUNS_TABLE = 'runs.csv'
+SHARD_GLOB = 'nodes_*.npz'
+
+def is_run_col(col):
+    return col in RUN_PARAM_COLS or col.endswith(DIST_SUFFIXES)
+
+def run_cols_for(eq_param_cols):
+    """
+    Every run-level column a sweep over eq_param_cols can produce
+    eq_param_cols mixes equation variable names and graph parameters
+    """
+    cols = set(RUN_PARAM_COLS)
+    for col in eq_param_cols:
+        if is_run_col(col):
+            cols.add(col)
+        else:
+            cols.update(col + suffix for suffix in DIST_SUFFIXES)
+    return sorted(cols)
+
+#### Encoding ##################################################################
+
+def node_column(col, values):
+    """
+    list of python values -> typed array
+    Labels that aren't ints (e.g. from graphml) fall back to strings
+    """
+    dtype = NODE_COL_DTYPES.get(col)
+    if dtype is not None:
+        try:
+            # None -> NaN -> MISSING
+            arr = np.array(values, dtype=float)
+        except (TypeError, ValueError):
+            return value_column(values, np.float64)
+        arr[np.isnan(arr)] = MISSING
+        return arr.astype(dtype)
+    return value_column(values, np.float64)
+
+def value_column(values, float_dtype):
+    """
+    Numbers and None -> floats with NaN, anything else -> strings
+    """
+    try:
+        return np.array(values, dtype=float_dtype)
+    except (TypeError, ValueError):
+        return np.array(['' if val is None else str(val) for val in values])
+
+def stored_column(arr):
+    """
+    A node column as shards store it, float64 comes back as float32
+    """
+    if arr.dtype == np.float64:
+        return arr.astype(np.float32)
+    return arr
+
+def stored_param(val):
+    """
+    A run param as it reads back from a shard, numbers come back as floats
+    """
+    val = value_column([val], np.float64).tolist()[0]
+    return None if val != val else val
+
+def missing_like(arr, n):
+    """
+    Fill for a node column a run doesn't have
+    """
+    if arr.dtype.kind in 'iu':
+        return np.full(n, MISSING, dtype=arr.dtype)
+    if arr.dtype.kind == 'f':
+        return np.full(n, np.nan, dtype=arr.dtype)
+    return np.full(n, '', dtype=arr.dtype)
+
+class RunColumns(object):
+    """
+    - inputs
+        columns: {col: typed array}, one entry per node
+        params: {col: value}, the run-level columns
+    """
+    def __init__(self, columns, params):
+        self.columns = columns
+        self.params = params
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+    @classmethod
+    def from_records(cls, list_of_record_dicts):
+        """
+        From make_csv_lines_from_sim style rows
+        """
+        first = list_of_record_dicts[0]
+        params = {col: val for col, val in first.items() if is_run_col(col)}
+        columns = {
+            col: node_column(
+                col,
+                [record.get(col) for record in list_of_record_dicts],
+            )
+            for col in first if not is_run_col(col)
+        }
+        return cls(columns, params)
+
+    def records(self):
+        """
+        One dict per node with the run's params attached, MISSING is None
+        """
+        cols = list(self.columns)
+        values = []
+        for col in cols:
+            arr = self.columns[col]
+            vals = arr.tolist()
+            if col in NODE_COL_DTYPES and arr.dtype.kind in 'iu':
+                vals = [None if val == MISSING else val for val in vals]
+            values.append(vals)
+        records = []
+        for row in zip(*values):
+            record = dict(zip(cols, row))
+            record.update(self.params)
+            records.append(record)
+        return records
+
+def as_run_columns(run):
+    if isinstance(run, RunColumns):
+        return run
+    return RunColumns.from_records(run)
+
+def write_shard(path, runs):
+    """
+    Inputs:
+        path: .npz file to write
+        runs: [RunColumns or list_of_record_dicts, ...], one per run
+
+    Outputs:
+        the params dict of each run, for the runs table
+    """
+    runs = [as_run_columns(run) for run in runs]
+    # first run to have a column decides its dtype
+    node_cols = {}
+    run_cols = set()
+    for run in runs:
+        for col, arr in run.columns.items():
+            node_cols.setdefault(col, arr)
+        run_cols.update(run.params)
+
+    arrays = {}
+    sizes = [len(run) for run in runs]
+    arrays['run'] = np.repeat(np.arange(len(runs), dtype=np.int32), sizes)
+    for col, like in node_cols.items():
+        arrays[col] = stored_column(np.concatenate([
+            run.columns[col] if col in run.columns
+            else missing_like(like, size)
+            for run, size in zip(runs, sizes)
+        ]))
+    run_rows = [
+        {col: run.params.get(col) for col in run_cols} for run in runs
+    ]
+    for col in run_cols:
+        arrays[RUN_PREFIX + col] = value_column(
+            [row[col] for row in run_rows],
+            np.float64,
+        )
+
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(tmp_path, path)
+    return run_rows
+
+#### Writer ####################################################################
+
+class ColumnarSimWriter(object):
+    """
+    Drop-in for SimWriter that writes a columnar output folder
+
+    Keeps runs.csv open for the whole sweep and buffers buffer_runs runs in
+    memory before writing them as one shard. Call close() (or use it as a
+    context manager) to write the last partial shard
+
+    Like SimWriter, starting a writer clears previous output in output_dir
+
+    runs.csv starts with the columns run_cols_for(eq_param_cols). A run
+    with a param outside them gets its own column, and runs.csv is
+    rewritten with it, so the table always matches the runs written
+    """
+
+    def __init__(self, output_dir, eq_param_cols, buffer_runs=1000):
+        self.output_dir = output_dir
+        self.buffer_runs = buffer_runs
+        self.buffer = []
+        self.reps = 0
+        self.shards = 0
+        os.makedirs(self.output_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(self.output_dir, SHARD_GLOB)):
+            os.remove(path)
+        # every run row so far, to rewrite runs.csv if a new column shows up
+        self.run_rows = []
+        self.run_cols = run_cols_for(eq_param_cols)
+        self.open_runs_table()
+
+    def open_runs_table(self, mode='w'):
+        self.runs_file = open(os.path.join(self.output_dir, RUNS_TABLE), mode)
+        self.runs_writer = csv.DictWriter(
+            self.runs_file,
+            fieldnames=['shard', 'run'] + self.run_cols,
+        )
+        if mode == 'w':
+            self.runs_writer.writeheader()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, run):
+        """
+        run: RunColumns or list_of_record_dicts
+        """
+        self.buffer.append(run)
+        if len(self.buffer) >= self.buffer_runs:
+            self.flush()
+        self.reps += 1
+        if self.reps % 100 == 0:
+            print('Finished {} reps'.format(self.reps))
+
+    def flush(self):
+        if not self.buffer:
+            return
+        shard_name = 'nodes_{:05d}.npz'.format(self.shards)
+        run_rows = write_shard(
+            os.path.join(self.output_dir, shard_name),
+            self.buffer,
+        )
+        for run_idx, row in enumerate(run_rows):
+            row['shard'] = shard_name
+            row['run'] = run_idx
+        self.run_rows.extend(run_rows)
+        new_cols = set(col for row in run_rows for col in row)
+        new_cols -= set(self.run_cols) | {'shard', 'run'}
+        if new_cols:
+            # a param run_cols_for didn't expect, widen the header
+            self.run_cols = sorted(set(self.run_cols) | new_cols)
+            self.runs_file.close()
+            self.open_runs_table()
+            run_rows = self.run_rows
+        for row in run_rows:
+            self.runs_writer.writerow(row)
+        self.runs_file.flush()
+        self.shards += 1
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        self.runs_file.close()
+
+def rebuild_runs_table(output_dir, shards=None):
+    """
+    Rewrites runs.csv from the run columns stored in the shards
+    For folders whose shards were written one at a time, e.g. by sweep.py
+    shards: file names to include, None for every shard in the folder
+    """
+    if shards is None:
+        paths = sorted(glob.glob(os.path.join(output_dir, SHARD_GLOB)))
+    else:
+        paths = [os.path.join(output_dir, shard) for shard in sorted(shards)]
+    run_rows = []
+    for path in paths:
+        with np.load(path) as arrs:
+            run_keys = [key for key in arrs.files if key.startswith(RUN_PREFIX)]
+            run_cols = {
+                key[len(RUN_PREFIX):]: arrs[key].tolist() for key in run_keys
+            }
+        n_runs = len(next(iter(run_cols.values()))) if run_cols else 0
+        for run_idx in range(n_runs):
+            row = {col: vals[run_idx] for col, vals in run_cols.items()}
+            row['shard'] = os.path.basename(path)
+            row['run'] = run_idx
+            run_rows.append(row)
+    cols = set(col for row in run_rows for col in row) - {'shard', 'run'}
+    runs_path = os.path.join(output_dir, RUNS_TABLE)
+    tmp_path = '{}.{}.tmp'.format(runs_path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        w = csv.DictWriter(f, fieldnames=['shard', 'run'] + sorted(cols))
+        w.writeheader()
+        for row in run_rows:
+            w.writerow(row)
+    os.replace(tmp_path, runs_path)
+
+#### Reading ###################################################################
+
+def load_shard(path):
+    """
+    Outputs:
+        node arrays (including 'run'), {run col: array with one entry per run}
+    """
+    with np.load(path) as arrs:
+        arrays = {key: arrs[key] for key in arrs.files}
+    run_arrays = {
+        key[len(RUN_PREFIX):]: arrays.pop(key)
+        for key in list(arrays) if key.startswith(RUN_PREFIX)
+    }
+    return arrays, run_arrays
+
+def read_shard(path):
+    """
+    Outputs:
+        runs_df: one row per run, run-level columns
+        nodes_df: one row per node, node columns plus 'run'
+    MISSING in int columns comes back as NaN, as with a blank csv cell
+    """
+    arrays, run_arrays = load_shard(path)
+    for col, dtype in NODE_COL_DTYPES.items():
+        if col in arrays and (arrays[col] == MISSING).any():
+            vals = arrays[col].astype(float)
+            vals[arrays[col] == MISSING] = np.nan
+            arrays[col] = vals
+    return pd.DataFrame(run_arrays), pd.DataFrame(arrays)
+
+def read_run_columns(path):
+    """
+    The RunColumns of a one-run shard, NaN run params come back as None
+    """
+    arrays, run_arrays = load_shard(path)
+    arrays.pop('run')
+    params = {}
+    for col, arr in run_arrays.items():
+        val = arr.tolist()[0]
+        params[col] = None if val != val else val
+    return RunColumns(arrays, params)
+
+def yield_shard_runs(path):
+    """
+    Yields (df_sim, params) for each run of a shard
+    df_sim has the node columns plus the run's parameters, like a run of
+    sim.csv
+    """
+    runs_df, nodes_df = read_shard(path)
+    run = nodes_df.pop('run').to_numpy()
+    bounds = np.flatnonzero(np.diff(run)) + 1
+    starts = np.concatenate([[0], bounds])
+    stops = np.concatenate([bounds, [len(run)]])
+    for start, stop in zip(starts, stops):
+        params = runs_df.iloc[run[start]].to_dict()
+        df_sim = nodes_df.iloc[start:stop].reset_index(drop=True)
+        df_sim = df_sim.assign(**params)
+        yield df_sim, params
+
+def yield_columnar_sim_records(output_dir):
+    """
+    Yields (df_sim, params) for every run in a ColumnarSimWriter folder
+    The shards listed in runs.csv if there is one, else every shard
+    """
+    runs_path = os.path.join(output_dir, RUNS_TABLE)
+    if os.path.exists(runs_path):
+        shards = pd.read_csv(runs_path, usecols=['shard'])['shard']
+        paths = [os.path.join(output_dir, shard) for shard in shards.unique()]
+    else:
+        paths = sorted(glob.glob(os.path.join(output_dir, SHARD_GLOB)))
+    for path in paths:
+        for df_sim, params in yield_shard_runs(path):
+            yield df_sim, params
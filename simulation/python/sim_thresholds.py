@@ -1,4 +1,3 @@
-import networkx as nx
 import pandas as pd
 import random
 from time import time
@@ -6,11 +5,19 @@ from functools import wraps
 import re
 import numpy as np
 import math
-import json
+import heapq
 import os
 import csv
 
 from constants import *
+from array_cascades import BatchThresholdSim
+from bitparallel import BitThresholdSim
+from network_stats import node_stats, NETWORK_STATS
+from run_summary import summarize_run
+from node_order import ShuffledIndex
+from sim_store import RunColumns, node_column, is_run_col,\
+                      NODE_COL_DTYPES, MISSING
+from topology import CSRGraph, as_topology, stack_topologies
 """
 Overview
 ~~~~~~~
@@ -79,7 +86,67 @@ def timer(f):
 
 #### Threshold draws ########################################################
 
-def create_thresholds(n, equation):
+def sample_thresholds(n, equation, rng=None):
+    """
+    inputs:
+        n: Number of samples to draw
+        equation: see create_thresholds, each variable's 'distribution' is
+            one of the ones written by sim_param_space.py:
+                'normal': draws normal(mean, sd)
+                'binomial': draws a 0/1 variable with P(1) = mean
+                'constant': the coefficient itself
+                'epsilon': draws normal(mean, sd), added as is
+        rng: numpy Generator, defaults to the global numpy random state
+    outputs:
+        {'var_name': array, ..., 'threshold': array}, one entry per node
+
+    Draws all variables of one distribution type in a single (n x n_vars)
+    call and computes threshold as covariates @ coefficients + constant +
+    epsilon
+    """
+    draw = np.random if rng is None else rng
+    table = {}
+    threshold = np.zeros(n)
+    for dist in ['normal', 'binomial']:
+        var_names = [
+            var_name for var_name, var_info in equation.items()
+            if var_info['distribution'] == dist
+            and var_name not in {'constant', 'epsilon'}
+        ]
+        if len(var_names) == 0:
+            continue
+        infos = [equation[var_name] for var_name in var_names]
+        means = np.array(
+            [var_info['mean'] or 0 for var_info in infos],
+            dtype=float,
+        )
+        coefs = np.array(
+            [var_info['coefficient'] for var_info in infos],
+            dtype=float,
+        )
+        if dist == 'normal':
+            sds = np.array([var_info['sd'] for var_info in infos], dtype=float)
+            draws = draw.normal(means, sds, size=(n, len(var_names)))
+        else:
+            draws = draw.binomial(1, means, size=(n, len(var_names)))
+        threshold += draws.dot(coefs)
+        for col, var_name in enumerate(var_names):
+            table[var_name] = draws[:, col]
+    if 'constant' in equation:
+        coefficient = equation['constant']['coefficient']
+        table['constant'] = np.full(n, coefficient)
+        threshold += coefficient
+    if 'epsilon' in equation:
+        var_info = equation['epsilon']
+        mean = var_info['mean'] or 0
+        table['epsilon'] = draw.normal(mean, var_info['sd'], size=n)
+        threshold += table['epsilon']
+    # keep the equation's variable order
+    table = {var_name: table[var_name] for var_name in equation}
+    table['threshold'] = threshold
+    return table
+
+def create_thresholds(n, equation, rng=None):
     """
     inputs:
         n: Number of samples to draw
@@ -95,44 +162,37 @@ def create_thresholds(n, equation):
             },
             ...
         }
+        rng: see sample_thresholds
     outputs:
         [
             {'var_name': value, 'threshold': value, ...}
         ]
 
+    Row-wise view of sample_thresholds
     """
-    output_list_of_dicts = []
-    for node in range(n):
-        node_variable_dict = {}
-        threshold_total = 0.0
-        for var_name, var_info in equation.items():
-            mean = var_info['mean']
-            sd = var_info['sd']
-            coefficient = var_info['coefficient']
-            if var_name == 'constant':
-                threshold_total += coefficient
-                node_variable_dict[var_name] = coefficient
-            elif var_name == 'epsilon':
-                draw = np.random.normal(0, sd)
-                node_variable_dict[var_name] = draw
-                threshold_total += draw
-            else:
-                draw = np.random.normal(0, sd)
-                node_variable_dict[var_name] = draw
-                threshold_total += coefficient * draw
-        node_variable_dict['threshold'] = threshold_total
-        output_list_of_dicts.append(node_variable_dict)
-    return output_list_of_dicts
+    table = sample_thresholds(n, equation, rng)
+    cols = list(table.keys())
+    rows = zip(*[table[col].tolist() for col in cols])
+    return [dict(zip(cols, row)) for row in rows]
 
 #### Graph setup functions ##################################################
 
-def label_graph_with_thresholds(graph, thresh_and_cov, network_stats=False):
+def label_graph_with_thresholds(
+    graph,
+    thresh_and_cov,
+    network_stats=False,
+    pivots=None,
+    topology=None,
+    ):
     """
     Assigns thresholds to nodes in graph
 
     Inputs:
         graph: NetworkX graph
         thresh_and_cov: [{'threshold': val, 'cov 1': val, 'cov 2': val}, ...]
+        pivots: passed to network_stats.node_stats, None is exact
+        topology: graph as a CSRGraph, if the caller has one, so network
+            stats don't freeze the graph again
 
     Note: Don't be stupid and make covariate names "threshold"
 
@@ -144,55 +204,43 @@ def label_graph_with_thresholds(graph, thresh_and_cov, network_stats=False):
         closeness
         betweenness
         pagerank
+
+    Degree is read off the graph, network stats are cached per graph, see
+    network_stats.py
     """
     assert graph.number_of_nodes() == len(thresh_and_cov)
 
-    degree = nx.degree_centrality(graph)
+    stats = ['degree']
     if network_stats == True:
-        closeness = nx.closeness_centrality(graph)
-        betweenness = nx.betweenness_centrality(graph)
-        pagerank = nx.pagerank_scipy(graph)
-        evcent = nx.eigenvector_centrality(graph)
+        stats += NETWORK_STATS
+    nodes, stat_arrays = node_stats(
+        graph,
+        stats,
+        pivots=pivots,
+        topology=topology,
+    )
+    stat_lists = {stat: arr.tolist() for stat, arr in stat_arrays.items()}
 
-    idx = 0
-    for name, node_attrs in graph.nodes_iter(data=True):
+    for idx, node in enumerate(nodes.tolist()):
+        node_attrs = graph.node[node]
         node_thresh_cov = thresh_and_cov[idx]
-        idx += 1
         node_attrs['activated'] = 0
         node_attrs['before_activation_alters'] = None
         node_attrs['after_activation_alters'] = None
         node_attrs['activation_order'] = None
         for cov_name, val in node_thresh_cov.items():
             node_attrs[cov_name] = val
-        node_attrs['degree'] = degree[name]
-        if network_stats == True:
-            node_attrs['closeness'] = closeness[idx]
-            node_attrs['betweenness'] = betweenness[idx]
-            node_attrs['pagerank'] = pagerank[idx]
-            node_attrs['evcent'] = evcent[idx]
+        for stat, vals in stat_lists.items():
+            node_attrs[stat] = vals[idx]
     return graph
 
-def yield_random_nodes(node_set):
-    """
-    Inputs:
-        node_set: an iterable containing nodes
-    Outputs:
-        Yields randomly shuffled nodes one at a time
-    Shuffle nodes without replacement
-
-    Assumption of without replacement should make little practical difference
-        It ensures our stop condition is correct
-    """
-    seq = np.random.choice(list(node_set), len(node_set), replace=False)
-    for elem in seq:
-        yield elem
-
 #### Simulation functions ###################################################
 
-def async_simulation(graph_with_thresholds):
+def async_simulation(graph_with_thresholds, rng=None):
     """
     Input:
         A graph with thresholds as node attributes
+        rng: numpy Generator, defaults to the global numpy random state
 
     Outputs:
         A graph with additional information on the nodes
@@ -211,26 +259,27 @@ def async_simulation(graph_with_thresholds):
             Just need node id, and number of active neighbors
     """
     g = graph_with_thresholds
-    all_node_set = set(g.nodes_iter())
-    num_nodes = len(all_node_set)
+    draw = np.random if rng is None else rng
+    nodes = g.nodes()
+    num_nodes = len(nodes)
 
     # activated_node_set = get_activated_node_set(g.node)
     activated_node_set = set()
-    unactivated_node_set = all_node_set
+    # unactivated node indices, walked in shuffled order from cursor
+    unactivated = ShuffledIndex(num_nodes)
+    unactivated.shuffle(draw)
+    cursor = 0
 
     steps_without_activation = 0
     activation_order = 0
-    node_rand_seq = yield_random_nodes(unactivated_node_set)
 
-    while len(unactivated_node_set) > 0:
-        try:
-            ego = next(node_rand_seq)
-        except StopIteration:
-            node_rand_seq = yield_random_nodes(unactivated_node_set)
-            ego = next(node_rand_seq)
-        # if person has activated, we skip them
-        if ego in activated_node_set:
-            continue
+    while len(unactivated) > 0:
+        # end of a pass, reshuffle whoever is left
+        if cursor == len(unactivated):
+            unactivated.shuffle(draw)
+            cursor = 0
+        ego_idx = unactivated.buf[cursor]
+        ego = nodes[ego_idx]
         alter_set = set(g[ego].keys())
         ego_num_activated_alters = len(alter_set & activated_node_set)
         threshold = g.node[ego]['threshold']
@@ -242,10 +291,12 @@ def async_simulation(graph_with_thresholds):
             # record activation status on graph
             g.node[ego]['activated'] = 1
             activated_node_set.add(ego)
-            unactivated_node_set.remove(ego)
+            # an unvisited node takes this slot, so the cursor stays put
+            unactivated.remove(ego_idx)
             steps_without_activation = 0
         else:
             g.node[ego]['before_activation_alters'] = ego_num_activated_alters
+            cursor += 1
             steps_without_activation += 1
             # stop condition here
             # because we randomize without replacement, if we visit a nubmer
@@ -256,9 +307,253 @@ def async_simulation(graph_with_thresholds):
                 break
     return g
 
+def async_simulation_incremental(graph_with_thresholds, rng=None):
+    """
+    Input:
+        A graph with thresholds as node attributes
+        rng: numpy Generator, defaults to the global numpy random state
+
+    Outputs:
+        The same as async_simulation
+
+    Same update procedure as async_simulation, but instead of intersecting
+    each ego's neighbor set with the activated set on every visit we keep an
+    integer exposure count per node. When a node activates it adds 1 to each
+    of its neighbors' counts, so a visit is one lookup
+    """
+    g = graph_with_thresholds
+    draw = np.random if rng is None else rng
+    topology = CSRGraph.from_networkx(g)
+    nodes = topology.nodes.tolist()
+    num_nodes = topology.n
+    indptr = topology.indptr.tolist()
+    indices = topology.indices.tolist()
+    nbr_lists = [
+        indices[indptr[idx]:indptr[idx + 1]] for idx in range(num_nodes)
+    ]
+    threshold = [g.node[node]['threshold'] for node in nodes]
+
+    exposure = [0] * num_nodes
+    activated = [0] * num_nodes
+    before_activation_alters = [None] * num_nodes
+    after_activation_alters = [None] * num_nodes
+    activation_orders = [None] * num_nodes
+
+    unactivated = ShuffledIndex(num_nodes)
+    unactivated.shuffle(draw)
+    cursor = 0
+
+    steps_without_activation = 0
+    activation_order = 0
+
+    while unactivated.size > 0:
+        if cursor == unactivated.size:
+            unactivated.shuffle(draw)
+            cursor = 0
+        ego = int(unactivated.buf[cursor])
+        ego_num_activated_alters = exposure[ego]
+        if ego_num_activated_alters >= threshold[ego]:
+            after_activation_alters[ego] = ego_num_activated_alters
+            activation_order += 1
+            activation_orders[ego] = activation_order
+            activated[ego] = 1
+            for alter in nbr_lists[ego]:
+                exposure[alter] += 1
+            unactivated.remove(ego)
+            steps_without_activation = 0
+        else:
+            before_activation_alters[ego] = ego_num_activated_alters
+            cursor += 1
+            steps_without_activation += 1
+            if steps_without_activation > num_nodes:
+                break
+
+    for idx, node in enumerate(nodes):
+        node_attrs = g.node[node]
+        node_attrs['activated'] = activated[idx]
+        node_attrs['before_activation_alters'] = before_activation_alters[idx]
+        node_attrs['after_activation_alters'] = after_activation_alters[idx]
+        node_attrs['activation_order'] = activation_orders[idx]
+    return g
+
+def async_simulation_skip(graph_with_thresholds, rng=None):
+    """
+    Input:
+        A graph with thresholds as node attributes
+        rng: numpy Generator, defaults to the global numpy random state
+
+    Outputs:
+        The same as async_simulation, with the same distribution
+
+    async_simulation spends most of its visits on nodes that can't activate.
+    Call an unactivated node eligible if exposure >= threshold. Between two
+    activations nothing changes, so every visit to a non-eligible node just
+    rewrites before_activation_alters with its current exposure
+
+    We draw each pass's shuffle up front and keep a heap of the pass
+    positions of eligible nodes. The next activation is the eligible node
+    with the smallest position after the cursor, and all the visits in
+    between are applied as one slice assignment. The stop rule counts those
+    skipped visits exactly, and once no node is eligible we finish the
+    remaining visits at once instead of sweeping until it fires
+
+    Python-level work is proportional to activations, skipped visits are
+    vectorized
+    """
+    g = graph_with_thresholds
+    draw = np.random if rng is None else rng
+    topology = CSRGraph.from_networkx(g)
+    nodes = topology.nodes.tolist()
+    num_nodes = topology.n
+    threshold = np.array([g.node[node]['threshold'] for node in nodes])
+
+    exposure = np.zeros(num_nodes, dtype=np.int64)
+    activated = np.zeros(num_nodes, dtype=bool)
+    before_activation_alters = np.full(num_nodes, np.nan)
+    after_activation_alters = np.full(num_nodes, np.nan)
+    activation_orders = np.full(num_nodes, np.nan)
+    pass_pos = np.zeros(num_nodes, dtype=np.int64)
+
+    steps_without_activation = 0
+    activation_order = 0
+    stopped = False
+
+    while not stopped and not activated.all():
+        seq = draw.permutation(np.flatnonzero(~activated))
+        pass_pos[seq] = np.arange(len(seq))
+        eligible = seq[exposure[seq] >= threshold[seq]]
+        if len(eligible) == 0:
+            # nothing can activate again, run out the stop rule's visits
+            visits_left = num_nodes + 1 - steps_without_activation
+            visited = seq[:visits_left]
+            before_activation_alters[visited] = exposure[visited]
+            break
+        heap = pass_pos[eligible].tolist()
+        heapq.heapify(heap)
+        cursor = 0
+        while True:
+            next_pos = heapq.heappop(heap) if heap else len(seq)
+            skipped = seq[cursor:next_pos]
+            visits_left = num_nodes + 1 - steps_without_activation
+            if len(skipped) >= visits_left:
+                skipped = skipped[:visits_left]
+                stopped = True
+            before_activation_alters[skipped] = exposure[skipped]
+            steps_without_activation += len(skipped)
+            if stopped or next_pos == len(seq):
+                break
+            ego = seq[next_pos]
+            after_activation_alters[ego] = exposure[ego]
+            activation_order += 1
+            activation_orders[ego] = activation_order
+            activated[ego] = True
+            steps_without_activation = 0
+            alters = topology.neighbors(ego)
+            exposure[alters] += 1
+            alters = alters[~activated[alters]]
+            # alters that just became eligible, visited later this pass if
+            # they come after ego, otherwise next pass
+            crossed = alters[
+                (exposure[alters] >= threshold[alters])
+                & (exposure[alters] - 1 < threshold[alters])
+                & (pass_pos[alters] > next_pos)
+            ]
+            for alter in crossed:
+                heapq.heappush(heap, pass_pos[alter])
+            cursor = next_pos + 1
+
+    before_activation_alters = none_or_int_list(before_activation_alters)
+    after_activation_alters = none_or_int_list(after_activation_alters)
+    activation_orders = none_or_int_list(activation_orders)
+    for idx, node in enumerate(nodes):
+        node_attrs = g.node[node]
+        node_attrs['activated'] = int(activated[idx])
+        node_attrs['before_activation_alters'] = before_activation_alters[idx]
+        node_attrs['after_activation_alters'] = after_activation_alters[idx]
+        node_attrs['activation_order'] = activation_orders[idx]
+    return g
+
+def sync_simulation(graph_with_thresholds, rng=None):
+    """
+    Input:
+        A graph with thresholds as node attributes
+        rng: numpy Generator, defaults to the global numpy random state
+
+    Outputs:
+        The same attributes as async_simulation, from the synchronous update
+        of BatchThresholdSim: every epoch, all nodes with exposure >= threshold
+        activate at once. activation_order is random within an epoch
+
+    One run of what run_sim_stacked does for many graphs at once
+    """
+    g = graph_with_thresholds
+    topology = CSRGraph.from_networkx(g)
+    nodes = topology.nodes.tolist()
+    threshold = np.array([g.node[node]['threshold'] for node in nodes])
+    batch = BatchThresholdSim(topology, threshold[:, None]).dynamics()
+    cols = batch.replicate_columns(0)
+    activation_orders = shuffled_activation_order(
+        batch.activation_epoch[:, 0],
+        rng,
+    )
+
+    before_activation_alters = none_or_int_list(cols['before_exposure'])
+    after_activation_alters = none_or_int_list(cols['exposure_at_activation'])
+    activation_orders = none_or_int_list(activation_orders)
+    for idx, node in enumerate(nodes):
+        node_attrs = g.node[node]
+        node_attrs['activated'] = int(cols['active'][idx])
+        node_attrs['before_activation_alters'] = before_activation_alters[idx]
+        node_attrs['after_activation_alters'] = after_activation_alters[idx]
+        node_attrs['activation_order'] = activation_orders[idx]
+    return g
+
+def shuffled_activation_order(activation_epoch, rng=None):
+    """
+    Epoch each node activated in (NaN if never) -> activation order
+    Nodes activating in the same epoch are ordered at random
+    """
+    draw = np.random if rng is None else rng
+    activated = np.flatnonzero(~np.isnan(activation_epoch))
+    order = activated[np.lexsort((
+        draw.random(len(activated)),
+        activation_epoch[activated],
+    ))]
+    activation_order = np.full(len(activation_epoch), np.nan)
+    activation_order[order] = np.arange(1, len(order) + 1)
+    return activation_order
+
+def none_or_int_list(arr):
+    """
+    Array with NaN for missing -> list of ints and None
+    """
+    return [None if val != val else int(val) for val in arr.tolist()]
+
+# engines run_sim can use, all take and return a graph with thresholds
+SIM_ENGINES = {
+    'async': async_simulation,
+    'incremental': async_simulation_incremental,
+    'skip': async_simulation_skip,
+    'sync': sync_simulation,
+}
+# bump when an engine's output changes, cached runs are keyed on this
+ENGINE_VERSIONS = {
+    'async': 1,
+    'incremental': 1,
+    'skip': 1,
+    'sync': 1,
+}
+
 def run_sim(
     graph,
     threshold_equation,
+    engine='async',
+    network_stats=False,
+    pivots=None,
+    topology=None,
+    rng=None,
+    columnar=False,
+    summaries=None,
     **kwargs
     ):
     """
@@ -266,32 +561,261 @@ def run_sim(
         graph: a graph structure with no additional annotation
         threshold_equation: a dictionary representing a threshold generating
             process. see create_thresholds for format
+        engine: a key of SIM_ENGINES
+        network_stats, pivots, topology: see label_graph_with_thresholds
+        rng: numpy Generator for thresholds and the engine, defaults to the
+            global numpy random state
+        columnar: return a RunColumns instead of row dicts
+        summaries: names from run_summary.SUMMARIES, returns one summary
+            record instead of the node records, see run_sim_summary
 
     Output:
-        returns a dataframe with the results of the simuation
+        returns a list_of_record_dicts with the results of the simuation
     """
+    if summaries is not None:
+        return run_sim_summary(
+            graph,
+            threshold_equation,
+            summaries,
+            engine=engine,
+            rng=rng,
+            **kwargs
+        )
     n = graph.number_of_nodes()
     thresh_and_cov = create_thresholds(
         n,
         threshold_equation,
+        rng=rng,
     )
     labeled_graph = label_graph_with_thresholds(
         graph,
         thresh_and_cov,
+        network_stats=network_stats,
+        pivots=pivots,
+        topology=topology,
     )
-    simulated_graph = async_simulation(labeled_graph)
-    list_of_record_dicts = make_csv_lines_from_sim(
+    simulated_graph = SIM_ENGINES[engine](labeled_graph, rng=rng)
+    run = make_sim_columns(
         simulated_graph,
         threshold_equation,
         **kwargs,
     )
-    return list_of_record_dicts
+    return finish_run(run, columnar, summaries)
+
+def run_sim_summary(
+    graph,
+    threshold_equation,
+    summaries,
+    engine='async',
+    rng=None,
+    **kwargs
+    ):
+    """
+    run_sim with summaries set, one summary record
+
+    The engines only read thresholds, so covariates, degree and network
+    stats never go on the graph, and only the outcomes the aggregates need
+    come back off it. Same thresholds and engine draws as run_sim
+    """
+    g = graph
+    nodes = g.nodes()
+    table = sample_thresholds(len(nodes), threshold_equation, rng)
+    for node, threshold in zip(nodes, table['threshold'].tolist()):
+        node_attrs = g.node[node]
+        node_attrs['threshold'] = threshold
+        node_attrs['activated'] = 0
+        node_attrs['before_activation_alters'] = None
+        node_attrs['after_activation_alters'] = None
+        node_attrs['activation_order'] = None
+    g = SIM_ENGINES[engine](g, rng=rng)
+    columns = dict(table)
+    for col in [
+        'activated',
+        'before_activation_alters',
+        'after_activation_alters',
+    ]:
+        columns[col] = node_column(col, [g.node[node][col] for node in nodes])
+    run = finish_sim_columns(columns, threshold_equation, **kwargs)
+    return summarize_run(run, summaries)
+
+def finish_run(run, columnar=False, summaries=None):
+    """
+    RunColumns -> what run_sim and friends return
+    """
+    if summaries is not None:
+        return summarize_run(run, summaries)
+    if columnar:
+        return run
+    return run.records()
+
+# synchronous engines over an (n_nodes x n_reps) threshold matrix
+# 'bits' packs 64 replicates per word, see bitparallel
+BATCH_ENGINES = {
+    'float': BatchThresholdSim,
+    'bits': BitThresholdSim,
+}
+
+def run_sim_batch(
+    graph,
+    threshold_equation,
+    n_reps,
+    columnar=False,
+    batch_engine='float',
+    summaries=None,
+    rng=None,
+    **kwargs
+    ):
+    """
+    Inputs:
+        graph: a graph structure with no additional annotation
+        threshold_equation: see create_thresholds for format
+        n_reps: number of replicates to run on this graph
+        columnar: return RunColumns instead of row dicts
+        batch_engine: a key of BATCH_ENGINES, same results either way
+        summaries: see run_sim, one summary record per replicate
+        rng: numpy Generator for thresholds and the engine, defaults to the
+            global numpy random state
+
+    Output:
+        a list with one list_of_record_dicts per replicate, same records as
+        run_sim
+
+    All replicates share the graph and run together in one batch engine
+    Note that this is a synchronous update, not the async_simulation one
+    """
+    n = graph.number_of_nodes()
+    nodes = graph.nodes()
+    draw = np.random if rng is None else rng
+    tables = [
+        sample_thresholds(n, threshold_equation, draw) for _ in range(n_reps)
+    ]
+    thresholds = np.column_stack([table['threshold'] for table in tables])
+    batch = BATCH_ENGINES[batch_engine](
+        graph,
+        thresholds,
+        rng=draw,
+    ).dynamics()
+    # summary runs skip the node columns no aggregate reads
+    if summaries is None:
+        degree = node_stats(graph, ['degree'])[1]['degree']
+        node_col = node_column('node', nodes)
+
+    reps = []
+    for rep, table in enumerate(tables):
+        cols = batch.replicate_columns(rep)
+        columns = dict(table)
+        columns['activated'] = cols['active'].astype(np.int8)
+        columns['before_activation_alters'] = nan_to_missing(
+            cols['before_exposure'],
+            'before_activation_alters',
+        )
+        columns['after_activation_alters'] = nan_to_missing(
+            cols['exposure_at_activation'],
+            'after_activation_alters',
+        )
+        if summaries is None:
+            columns['node'] = node_col
+            columns['degree'] = degree
+            columns['activation_order'] = nan_to_missing(
+                cols['activation_order'],
+                'activation_order',
+            )
+        run = finish_sim_columns(columns, threshold_equation, **kwargs)
+        reps.append(finish_run(run, columnar, summaries))
+    return reps
+
+def run_sim_stacked(
+    graphs,
+    threshold_equation,
+    rngs=None,
+    run_ids=None,
+    params=None,
+    columnar=False,
+    summaries=None,
+    **kwargs
+    ):
+    """
+    Inputs:
+        graphs: [graph or CSRGraph, ...], one run on each
+        threshold_equation: see create_thresholds for format
+        rngs: numpy Generator per graph, defaults to the global numpy random
+            state
+        run_ids: rand_string per graph, random strings if not given
+        params: dict per graph of run-level columns (graph_type, mean_deg,
+            rewire_prob, ...), on top of kwargs
+        columnar: return RunColumns instead of row dicts
+        summaries: see run_sim, one summary record per graph
+
+    Output:
+        a list with one list_of_record_dicts per graph, the same records as
+        run_sim(graph, threshold_equation, engine='sync', rng=rng)
+
+    For sweeps over many small graphs, where per-graph overhead dominates.
+    The graphs are stacked into one block-diagonal graph and all the runs go
+    through a single BatchThresholdSim call, then get split back into runs.
+    Unlike run_sim_batch, every run has its own topology
+    """
+    n_runs = len(graphs)
+    rngs = rngs or [None] * n_runs
+    run_ids = run_ids or [None] * n_runs
+    params = params or [{}] * n_runs
+    topologies = [as_topology(graph) for graph in graphs]
+    tables = [
+        sample_thresholds(topology.n, threshold_equation, rng)
+        for topology, rng in zip(topologies, rngs)
+    ]
+    stacked, offsets = stack_topologies(topologies)
+    thresholds = np.concatenate([table['threshold'] for table in tables])
+    batch = BatchThresholdSim(stacked, thresholds[:, None]).dynamics()
+    cols = batch.replicate_columns(0)
+
+    runs = []
+    for k, (topology, table) in enumerate(zip(topologies, tables)):
+        block = slice(offsets[k], offsets[k + 1])
+        columns = dict(table)
+        columns['activated'] = cols['active'][block].astype(np.int8)
+        columns['before_activation_alters'] = nan_to_missing(
+            cols['before_exposure'][block],
+            'before_activation_alters',
+        )
+        columns['after_activation_alters'] = nan_to_missing(
+            cols['exposure_at_activation'][block],
+            'after_activation_alters',
+        )
+        # summary runs skip the node columns no aggregate reads
+        if summaries is None:
+            columns['node'] = node_column('node', topology.nodes.tolist())
+            columns['degree'] = node_stats(topology, ['degree'])[1]['degree']
+            columns['activation_order'] = nan_to_missing(
+                shuffled_activation_order(
+                    batch.activation_epoch[block, 0],
+                    rngs[k],
+                ),
+                'activation_order',
+            )
+        run_params = dict(kwargs)
+        run_params.update(params[k])
+        run = finish_sim_columns(
+            columns,
+            threshold_equation,
+            run_ids[k],
+            **run_params
+        )
+        runs.append(finish_run(run, columnar, summaries))
+    return runs
 
 #### postprocessing functions ###############################################
 
-def make_csv_lines_from_sim(
+def nan_to_missing(arr, col):
+    """
+    Float array with NaN for None -> typed node column
+    """
+    return np.where(np.isnan(arr), MISSING, arr).astype(NODE_COL_DTYPES[col])
+
+def make_sim_columns(
     graph_after_simulation,
     threshold_equation,
+    run_id=None,
     **kwargs
     ):
     """
@@ -309,22 +833,51 @@ def make_csv_lines_from_sim(
             'degree': int
         }
 
-    We use this to make a pandas dataframe
-    One row per node
+    We pull each attribute out into a typed column (see sim_store), one
+    entry per node, and finish with finish_sim_columns
 
-    We have a bunch of standard col names, plus the cov names
-        covs can be 0, 1, 2, etc cols
+    run_id goes in the rand_string column, a random string if not given
     """
     g = graph_after_simulation
-    def subtract_or_none(x, y):
-        if x != None and y != None:
-            return x - y
-        else:
-            return None
+    nodes = []
+    node_attr_dicts = []
+    for node, node_attrs in g.nodes_iter(data=True):
+        nodes.append(node)
+        node_attr_dicts.append(node_attrs)
+    columns = {'node': node_column('node', nodes)}
+    for col in node_attr_dicts[0]:
+        if col in columns or is_run_col(col) or col == 'observed':
+            continue
+        columns[col] = node_column(
+            col,
+            [node_attrs[col] for node_attrs in node_attr_dicts],
+        )
+    return finish_sim_columns(columns, threshold_equation, run_id, **kwargs)
+
+def finish_sim_columns(columns, threshold_equation, run_id=None, **kwargs):
+    """
+    Adds observed to the node columns and builds the run-level params once
+
+    observed: we saw the node one exposure before it activated
+        after - before == 1, and after > 0
+    With before or after missing it's 0
+    """
     def rand_string():
         return ''.join([random.choice(CHARS) for _ in range(8)])
 
-    threshold_eq_summary = {'rand_string': rand_string()}
+    before = columns['before_activation_alters']
+    after = columns['after_activation_alters']
+    observed = (
+        (before != MISSING)
+        & (after != MISSING)
+        & (after != 0)
+        & (after.astype(np.int64) - before == 1)
+    )
+    columns['observed'] = observed.astype(np.int8)
+
+    if run_id is None:
+        run_id = rand_string()
+    threshold_eq_summary = {'rand_string': run_id}
     for var_name, var_info in threshold_equation.items():
         var_name_fmt = var_name + '_dist'
         threshold_eq_summary[var_name_fmt + '_mean'] = var_info['mean']
@@ -332,26 +885,24 @@ def make_csv_lines_from_sim(
         threshold_eq_summary[var_name_fmt + '_coef'] = var_info['coefficient']
     for k, v in kwargs.items():
         threshold_eq_summary[k] = v
+    return RunColumns(columns, threshold_eq_summary)
 
-    list_of_record_dicts = []
-    for node, node_attrs in g.nodes_iter(data=True):
-        node_attrs['node'] = node
-        activated = node_attrs['activated']
-        after_activation_alters = node_attrs['after_activation_alters']
-        before_activation_alters = node_attrs['before_activation_alters']
-        difference = subtract_or_none(
-            after_activation_alters,
-            before_activation_alters,
-        )
-        if after_activation_alters == 0:
-            node_attrs['observed'] = 0
-        elif difference == 1:
-            node_attrs['observed'] = 1
-        else:
-            node_attrs['observed'] = 0
-        node_attrs.update(threshold_eq_summary)
-        list_of_record_dicts.append(node_attrs)
-    return list_of_record_dicts
+def make_csv_lines_from_sim(
+    graph_after_simulation,
+    threshold_equation,
+    run_id=None,
+    **kwargs
+    ):
+    """
+    Row view of make_sim_columns: one dict per node, with the node's
+    attributes, 'node', 'observed' and the run-level params
+    """
+    return make_sim_columns(
+        graph_after_simulation,
+        threshold_equation,
+        run_id,
+        **kwargs
+    ).records()
 
 #### Writer class ###########################################################
 
@@ -402,60 +953,5 @@ class SimWriter(object):
             print('Finished {} reps'.format(self.reps))
 
 if __name__ == '__main__':
-    #### Constants ##########################################################
-    N_REPS = 1000
-
-    threshold_eq_param_space = []
-    with open(SIM_PARAM_FILE, 'r') as f:
-        for line in f:
-            j = json.loads(line)
-            threshold_eq_param_space.append(j)
-    mean_degrees = [12, 16, 20]
-    graph_sizes = [1000]
-    ws_rewire_probs = [.1]
-    pl_cluster_probs = [.1]
-
-    eq_param_cols = set(
-        [k for d in threshold_eq_param_space for k, v in d.items()]
-    )
-    # these are additional sim params that we may want to play with
-    eq_param_cols.update([
-        'graph_type',
-        'mean_deg',
-        'graph_size',
-        'rewire_prob',
-        'cluster_prob',
-    ])
-
-    sw = SimWriter(SIM_PATH, eq_param_cols)
-
-    # this is for purely sim graphs
-    for eq in threshold_eq_param_space:
-        for md in mean_degrees:
-            for gs in graph_sizes:
-                print("{} {} {}".format(eq, md, gs))
-                for _ in range(N_REPS):
-                    # ws
-                    for p in ws_rewire_probs:
-                        ws_graph = nx.watts_strogatz_graph(gs, md, p)
-                        reps = run_sim(
-                            ws_graph,
-                            eq,
-                            graph_type='ws',
-                            mean_deg=md,
-                            graph_size=gs,
-                            rewire_prob=p,
-                        )
-                        sw.write(reps)
-                    # pl w/ clustering
-                    for c in pl_cluster_probs:
-                        plc_graph = nx.powerlaw_cluster_graph(gs, int(md/2.), c)
-                        reps = run_sim(
-                            plc_graph,
-                            eq,
-                            graph_type='plc',
-                            mean_deg=md,
-                            graph_size=gs,
-                            cluster_prob=c,
-                        )
-                        sw.write(reps)
+    from sweep import run_sweep
+    run_sweep(SIM_COLUMNAR_PATH)
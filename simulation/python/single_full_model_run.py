@@ -10,53 +10,70 @@ error sd: 1
 import csv
 import json
 import networkx as nx
+import numpy as np
+import pandas as pd
 from constants import *
+from node_order import ShuffledIndex
 from sim_thresholds import create_thresholds,\
-                           label_graph_with_thresholds,\
-                           yield_random_nodes
-from math import floor, ceil
+                           label_graph_with_thresholds
+from visit_trace import TraceRecorder, yield_trace_frames
 
-def async_simulation_log(graph_with_thresholds):
+# columns of the per-visit table, ONE_OFF_DF_PATH
+ONE_OFF_FIELDS = ['epsilon',
+                  'threshold',
+                  'exposure',
+                  'activation_order',
+                  'iteration',
+                  'activated',
+                  'after_activation_alters',
+                  'var1',
+                  'constant',
+                  'before_activation_alters']
+ONE_OFF_INT_FIELDS = ['exposure',
+                      'activation_order',
+                      'iteration',
+                      'activated',
+                      'after_activation_alters',
+                      'before_activation_alters']
+
+def async_simulation_log(
+    graph_with_thresholds,
+    trace_path=ONE_OFF_TRACE_PATH,
+    rng=None,
+):
     """
     Repeats the async_simulation function in sim_thresholds.py
     But writes every observation to a file on disk
     In other words, we record every activation
+
+    Every visit goes to a binary trace at trace_path, see visit_trace.py
+    Nodes in the trace are positions in g.nodes() order, the row order of
+    the node table saved at ONE_OFF_SIM_PATH
+    rng: numpy Generator, defaults to the global numpy random state
     """
     g = graph_with_thresholds
-    all_node_set = set(g.nodes_iter())
-    num_nodes = len(all_node_set)
+    draw = np.random if rng is None else rng
+    nodes = g.nodes()
+    num_nodes = len(nodes)
 
     activated_node_set = set()
-    unactivated_node_set = all_node_set
+    # unactivated node indices, walked in shuffled order from cursor
+    unactivated = ShuffledIndex(num_nodes)
+    unactivated.shuffle(draw)
+    cursor = 0
 
     steps_without_activation = 0
     activation_order = 0
     iteration = 0
-    node_rand_seq = yield_random_nodes(unactivated_node_set)
-
-    with open(ONE_OFF_DF_PATH, 'w') as outfile:
-        writer = csv.DictWriter(
-            outfile,
-            fieldnames=['epsilon',
-                        'threshold',
-                        'exposure',
-                        'activation_order',
-                        'iteration',
-                        'activated',
-                        'after_activation_alters',
-                        'var1',
-                        'constant',
-                        'before_activation_alters'],
-            extrasaction='ignore')
-        writer.writeheader()
-        while len(unactivated_node_set) > 0:
-            try:
-                ego = next(node_rand_seq)
-            except StopIteration:
-                node_rand_seq = yield_random_nodes(unactivated_node_set)
-                ego = next(node_rand_seq)
-            if ego in activated_node_set:
-                continue
+
+    with TraceRecorder(trace_path) as recorder:
+        while len(unactivated) > 0:
+            # end of a pass, reshuffle whoever is left
+            if cursor == len(unactivated):
+                unactivated.shuffle(draw)
+                cursor = 0
+            ego_idx = unactivated.buf[cursor]
+            ego = nodes[ego_idx]
             iteration += 1
             alter_set = set(g[ego].keys())
             ego_num_activated_alters = len(alter_set & activated_node_set)
@@ -71,14 +88,26 @@ def async_simulation_log(graph_with_thresholds):
                 # record activation status on graph
                 g.node[ego]['activated'] = 1
                 activated_node_set.add(ego)
-                unactivated_node_set.remove(ego)
+                # an unvisited node takes this slot, so the cursor stays put
+                unactivated.remove(ego_idx)
                 steps_without_activation = 0
-                writer.writerow(g.node[ego])
+                recorder.record(
+                    iteration,
+                    ego_idx,
+                    ego_num_activated_alters,
+                    1,
+                )
             else:
                 g.node[ego]['before_activation_alters'] = \
                     ego_num_activated_alters
+                cursor += 1
                 steps_without_activation += 1
-                writer.writerow(g.node[ego])
+                recorder.record(
+                    iteration,
+                    ego_idx,
+                    ego_num_activated_alters,
+                    0,
+                )
                 if steps_without_activation > num_nodes:
                     break
 
@@ -91,6 +120,117 @@ def async_simulation_log(graph_with_thresholds):
         writer.writeheader()
         for record in records:
             writer.writerow(record)
+    return g
+
+def visit_frame(trace_frame, nodes_df):
+    """
+    Inputs:
+        trace_frame: a frame from visit_trace.yield_trace_frames
+        nodes_df: the node table after the run, one row per node in
+            g.nodes() order
+
+    Outputs:
+        one row per visit with the node's columns, as they were at the visit:
+        before_activation_alters is the visit's exposure until the node
+        activates, after_activation_alters and activation_order are only
+        set on the activating visit
+    """
+    visits = nodes_df.iloc[trace_frame['node'].to_numpy()]
+    visits = visits.reset_index(drop=True)
+    for col in ['iteration', 'exposure', 'activated']:
+        visits[col] = trace_frame[col].to_numpy()
+    activated = visits['activated'] == 1
+    visits['before_activation_alters'] = visits[
+        'before_activation_alters'
+    ].where(activated, visits['exposure'])
+    for col in ['after_activation_alters', 'activation_order']:
+        visits[col] = visits[col].where(activated)
+    for col in ONE_OFF_INT_FIELDS:
+        visits[col] = visits[col].astype('Int64')
+    return visits[ONE_OFF_FIELDS]
+
+def yield_visit_frames(g, trace_path=ONE_OFF_TRACE_PATH):
+    """
+    visit_frame for each chunk of the trace of g's run
+    """
+    nodes_df = pd.DataFrame([g.node[node] for node in g.nodes()])
+    for trace_frame in yield_trace_frames(trace_path):
+        yield visit_frame(trace_frame, nodes_df)
+
+def write_frames(frames, path):
+    """
+    Streams frames to one csv, header from the first
+    Line endings as the csv module writes them
+    """
+    for chunk_idx, frame in enumerate(frames):
+        frame.to_csv(
+            path,
+            mode='w' if chunk_idx == 0 else 'a',
+            header=chunk_idx == 0,
+            index=False,
+            lineterminator='\r\n',
+        )
+
+def write_visit_table(g, trace_path=ONE_OFF_TRACE_PATH, path=ONE_OFF_DF_PATH):
+    """
+    Writes the trace joined with the node table as csv, one chunk at a time
+    """
+    write_frames(yield_visit_frames(g, trace_path), path)
+
+#### Ideal randomized control trial ############################################
+
+def ideal_trial_rows(threshold):
+    """
+    Inputs:
+        threshold: array, one entry per activated row
+
+    Outputs:
+        source: the activated row each ideal row copies
+        exposure, activated: the ideal rows' values for those columns
+
+    Each activated row becomes, in order:
+        the row at exposure max(0, ceil(threshold)), activated
+        the rows at exposures 0..max(0, floor(threshold)), not activated
+    """
+    n_rows = np.maximum(0, np.floor(threshold)).astype(np.int64) + 2
+    source = np.repeat(np.arange(len(threshold)), n_rows)
+    # step 0 is the activation row, step k the row at exposure k - 1
+    starts = np.cumsum(n_rows) - n_rows
+    step = np.arange(n_rows.sum()) - np.repeat(starts, n_rows)
+    at_threshold = np.maximum(0, np.ceil(threshold)).astype(np.int64)
+    exposure = np.where(step == 0, at_threshold[source], step - 1)
+    activated = (step == 0).astype(np.int64)
+    return source, exposure, activated
+
+def ideal_trial_frame(visits):
+    """
+    Inputs:
+        visits: frame with 'threshold' and 'activated' columns, e.g. from
+            visit_frame, or a run's node records from a sweep
+
+    Outputs:
+        the ideal randomized control trial world, see ideal_trial_rows
+        i.e. we assume they activated at the "right" time and go back
+        through previous exposures
+    """
+    activated = visits[visits['activated'] == 1]
+    source, exposure, is_activated = ideal_trial_rows(
+        activated['threshold'].to_numpy(dtype=float),
+    )
+    ideal = activated.iloc[source].reset_index(drop=True)
+    ideal['exposure'] = exposure
+    ideal['activated'] = is_activated
+    return ideal
+
+def write_ideal_table(visit_frames, path=ONE_OFF_IDEAL_DF_PATH):
+    """
+    Streams ideal_trial_frame of each frame to one csv
+    visit_frames: frames in memory, e.g. yield_visit_frames(g)
+    """
+    write_frames(
+        (ideal_trial_frame(frame) for frame in visit_frames),
+        path,
+    )
 
 if __name__ == '__main__':
     eq = {
@@ -124,31 +264,7 @@ if __name__ == '__main__':
         thresh_and_cov,
     )
     simulated_graph = async_simulation_log(labeled_graph)
+    write_visit_table(simulated_graph)
 
     # ideal randomized control trial world
-    with open(ONE_OFF_DF_PATH, 'r') as infile:
-        reader = csv.DictReader(infile)
-        with open(ONE_OFF_IDEAL_DF_PATH, 'w') as outfile:
-            writer = csv.DictWriter(outfile,
-                                    fieldnames=['epsilon',
-                                                'threshold',
-                                                'exposure',
-                                                'activation_order',
-                                                'iteration',
-                                                'activated',
-                                                'after_activation_alters',
-                                                'var1',
-                                                'constant',
-                                                'before_activation_alters'])
-            writer.writeheader()
-            for row in reader:
-                if row['activated'] == '1':
-                    # assume they activated at "right" time
-                    row['exposure'] = str(max(0, ceil(float(row['threshold']))))
-                    writer.writerow(row)
-                    thresh_floor = max(0, floor(float(row['threshold'])))
-                    # go back through previous exposures
-                    row['activated'] = '0'
-                    for prev_exposure in range(thresh_floor + 1):
-                        row['exposure'] = str(prev_exposure)
-                        writer.writerow(row)
+    write_ideal_table(yield_visit_frames(simulated_graph))
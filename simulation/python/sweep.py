@@ -0,0 +1,346 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import numpy as np
+
+from constants import *
+from graph_pool import GraphPool, GRAPH_GENERATOR_VERSIONS
+from result_cache import ResultCache, run_id, run_seed
+from run_summary import summarize_run, write_summaries,\
+                        rebuild_summary_table, SUMMARY_GLOB
+from sim_store import write_shard, rebuild_runs_table, SHARD_GLOB
+from sim_thresholds import run_sim, run_sim_stacked, ENGINE_VERSIONS
+
+"""
+Checkpointed, resumable parameter sweep for sim_thresholds
+
+The sweep is expanded up front into a manifest of tasks:
+    equations in SIM_PARAM_FILE
+    x graph cells (graph type, size, mean degree, rewire/cluster prob)
+    x blocks of REPS_PER_TASK replicates
+
+A task's id is a hash of its content. A worker runs the task's replicates
+(graph k of a cell comes from the graph pool) and writes them as one shard,
+nodes_<task id>.npz, atomically. The parent then appends the task id to
+ledger.jsonl
+
+On restart, tasks in the ledger whose shard exists are skipped, so a killed
+sweep picks up where it left off and reruns at most the tasks in flight.
+runs.csv only indexes the shards of the current manifest, so shards left by
+tasks whose content changed (e.g. a new generator version) drop out
+
+Each replicate's run id and seed are a hash of its run spec, see
+result_cache. Finished runs go in the result cache, and a task serves
+cached runs instead of simulating them, so a new sweep folder (or a task
+reshuffled by changing REPS_PER_TASK) only simulates runs it has never seen
+
+With engine='sync' a task's uncached replicates, each on its own pool
+graph, run together through run_sim_stacked instead of one run_sim call
+per graph. The records are the same as run_sim with the 'sync' engine
+
+Output reads like any ColumnarSimWriter folder, see sim_store
+
+With summaries set, tasks write one summary record per run instead of the
+node shard, summary_<task id>.csv, merged into summaries.csv at the end
+(see run_summary). Cached runs are still served, but new runs aren't
+cached, since that would write the node columns we're skipping
+
+Functions:
+    - make_manifest
+    - read_ledger
+    - run_task
+    - run_sweep
+"""
+
+N_REPS = 1000
+REPS_PER_TASK = 50
+MEAN_DEGREES = [12, 16, 20]
+GRAPH_SIZES = [1000]
+# graph type -> (probabilities, name of the probability column)
+GRAPH_PROBS = {
+    'ws': ([.1], 'rewire_prob'),
+    'plc': ([.1], 'cluster_prob'),
+}
+# the baseline engine, pass engine='skip' for the faster one with the same
+# distribution
+ENGINE = 'async'
+# engines whose tasks run all their graphs in one stacked call
+STACKED_ENGINES = {'sync'}
+
+MANIFEST = 'manifest.json'
+LEDGER = 'ledger.jsonl'
+
+#### Manifest ##################################################################
+
+def load_equations(path=SIM_PARAM_FILE):
+    equations = []
+    with open(path, 'r') as f:
+        for line in f:
+            equations.append(json.loads(line))
+    return equations
+
+def task_digest(task):
+    """
+    sha1 of everything that determines the task's output
+    """
+    content = {k: v for k, v in task.items() if k != 'task_id'}
+    return hashlib.sha1(
+        json.dumps(content, sort_keys=True).encode()
+    ).digest()
+
+def make_manifest(
+    equations,
+    n_reps=N_REPS,
+    reps_per_task=REPS_PER_TASK,
+    engine=ENGINE,
+    summaries=None,
+    ):
+    """
+    Outputs:
+        [{'task_id': str, 'equation': {...}, 'graph_type': str,
+          'graph_size': int, 'mean_deg': int, 'prob': float,
+          'rep_start': int, 'rep_stop': int, 'engine': str,
+          'graph_version': int}, ...]
+        plus 'summaries': [name, ...] in summary mode
+    """
+    tasks = []
+    for eq in equations:
+        for graph_type, (probs, _) in sorted(GRAPH_PROBS.items()):
+            for gs in GRAPH_SIZES:
+                for md in MEAN_DEGREES:
+                    for p in probs:
+                        for rep_start in range(0, n_reps, reps_per_task):
+                            rep_stop = min(n_reps, rep_start + reps_per_task)
+                            task = {
+                                'equation': eq,
+                                'graph_type': graph_type,
+                                'graph_size': gs,
+                                'mean_deg': md,
+                                'prob': p,
+                                'rep_start': rep_start,
+                                'rep_stop': rep_stop,
+                                'engine': engine,
+                                'graph_version':
+                                    GRAPH_GENERATOR_VERSIONS[graph_type],
+                            }
+                            if summaries is not None:
+                                task['summaries'] = list(summaries)
+                            task['task_id'] = task_digest(task).hex()[:16]
+                            tasks.append(task)
+    return tasks
+
+def shard_name(task_id):
+    return SHARD_GLOB.replace('*', task_id)
+
+def output_name(task):
+    """
+    The file a task writes, its node shard or its summary table
+    """
+    if task.get('summaries') is not None:
+        return SUMMARY_GLOB.replace('*', task['task_id'])
+    return shard_name(task['task_id'])
+
+def write_manifest(output_dir, tasks):
+    path = os.path.join(output_dir, MANIFEST)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(tasks, f)
+    os.replace(tmp_path, path)
+
+def read_ledger(output_dir):
+    """
+    Ids of finished tasks whose shard is on disk
+    A torn last line from a crash is ignored
+    """
+    done = set()
+    path = os.path.join(output_dir, LEDGER)
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if os.path.exists(os.path.join(output_dir, entry['shard'])):
+                done.add(entry['task_id'])
+    return done
+
+#### Running ###################################################################
+
+# per process, set by init_worker
+_output_dir = None
+_graph_pool = None
+_result_cache = None
+
+def init_worker(output_dir, graph_pool_path, cache_path, cache_bytes):
+    global _output_dir, _graph_pool, _result_cache
+    _output_dir = output_dir
+    _graph_pool = GraphPool(graph_pool_path)
+    _result_cache = None
+    if cache_path is not None:
+        _result_cache = ResultCache(cache_path, cache_bytes)
+
+def run_spec(task, rep):
+    """
+    Everything that determines one replicate's records
+    """
+    return {
+        'equation': task['equation'],
+        'graph_type': task['graph_type'],
+        'graph_size': task['graph_size'],
+        'mean_deg': task['mean_deg'],
+        'prob': task['prob'],
+        'rep': rep,
+        'engine': task['engine'],
+        'engine_version': ENGINE_VERSIONS[task['engine']],
+        'graph_version': GRAPH_GENERATOR_VERSIONS[task['graph_type']],
+    }
+
+def run_task(task):
+    """
+    Runs a task's replicates and writes its shard, returns the task id
+    """
+    _, prob_col = GRAPH_PROBS[task['graph_type']]
+    sim_kwargs = {
+        'graph_type': task['graph_type'],
+        'mean_deg': task['mean_deg'],
+        'graph_size': task['graph_size'],
+        prob_col: task['prob'],
+    }
+    reps = list(range(task['rep_start'], task['rep_stop']))
+    specs = [run_spec(task, rep) for rep in reps]
+    rids = [run_id(spec) for spec in specs]
+    summaries = task.get('summaries')
+    runs = [None] * len(reps)
+    if _result_cache is not None:
+        runs = [_result_cache.get(rid) for rid in rids]
+        if summaries is not None:
+            runs = [
+                None if run is None else summarize_run(run, summaries)
+                for run in runs
+            ]
+    todo = [idx for idx, run in enumerate(runs) if run is None]
+
+    def pool_graph(rep, topology=False):
+        get = _graph_pool.get_topology if topology else _graph_pool.get_graph
+        return get(
+            task['graph_type'],
+            task['graph_size'],
+            task['mean_deg'],
+            task['prob'],
+            rep,
+        )
+
+    if task['engine'] in STACKED_ENGINES and todo:
+        new_runs = run_sim_stacked(
+            [pool_graph(reps[idx], topology=True) for idx in todo],
+            task['equation'],
+            rngs=[np.random.default_rng(run_seed(specs[idx])) for idx in todo],
+            run_ids=[rids[idx] for idx in todo],
+            columnar=True,
+            summaries=summaries,
+            **sim_kwargs
+        )
+    else:
+        new_runs = [
+            run_sim(
+                pool_graph(reps[idx]),
+                task['equation'],
+                engine=task['engine'],
+                rng=np.random.default_rng(run_seed(specs[idx])),
+                columnar=True,
+                summaries=summaries,
+                run_id=rids[idx],
+                **sim_kwargs
+            )
+            for idx in todo
+        ]
+    for idx, run in zip(todo, new_runs):
+        if _result_cache is not None and summaries is None:
+            _result_cache.put(rids[idx], run)
+        runs[idx] = run
+    path = os.path.join(_output_dir, output_name(task))
+    if summaries is not None:
+        write_summaries(path, runs)
+    else:
+        write_shard(path, runs)
+    return task['task_id']
+
+def run_sweep(
+    output_dir,
+    equations=None,
+    n_reps=N_REPS,
+    reps_per_task=REPS_PER_TASK,
+    n_workers=None,
+    graph_pool_path=GRAPH_POOL_PATH,
+    cache_path=RESULT_CACHE_PATH,
+    cache_bytes=RESULT_CACHE_BYTES,
+    engine=ENGINE,
+    summaries=None,
+    ):
+    """
+    Runs every task not already in the ledger, then rebuilds runs.csv
+
+    n_workers=1 runs in this process, None uses every core
+    cache_path=None turns off the result cache
+    engine: a key of sim_thresholds.SIM_ENGINES, 'sync' runs stacked
+    summaries: names from run_summary.SUMMARIES, writes summaries.csv
+        instead of node shards
+    """
+    if equations is None:
+        equations = load_equations()
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = make_manifest(
+        equations,
+        n_reps,
+        reps_per_task,
+        engine,
+        summaries,
+    )
+    names = {task['task_id']: output_name(task) for task in tasks}
+    write_manifest(output_dir, tasks)
+    done = read_ledger(output_dir)
+    pending = [task for task in tasks if task['task_id'] not in done]
+    print('{} tasks, {} done, {} to run'.format(
+        len(tasks),
+        len(tasks) - len(pending),
+        len(pending),
+    ))
+
+    with open(os.path.join(output_dir, LEDGER), 'a') as ledger:
+        def record(task_id):
+            entry = {'task_id': task_id, 'shard': names[task_id]}
+            ledger.write(json.dumps(entry) + '\n')
+            ledger.flush()
+            os.fsync(ledger.fileno())
+
+        if n_workers == 1:
+            init_worker(output_dir, graph_pool_path, cache_path, cache_bytes)
+            for n_done, task in enumerate(pending, 1):
+                record(run_task(task))
+                print('Finished {} of {} tasks'.format(n_done, len(pending)))
+        else:
+            with multiprocessing.Pool(
+                n_workers,
+                initializer=init_worker,
+                initargs=(
+                    output_dir,
+                    graph_pool_path,
+                    cache_path,
+                    cache_bytes,
+                ),
+            ) as pool:
+                results = pool.imap_unordered(run_task, pending)
+                for n_done, task_id in enumerate(results, 1):
+                    record(task_id)
+                    print('Finished {} of {} tasks'.format(
+                        n_done,
+                        len(pending),
+                    ))
+    # only this manifest's outputs, not those of tasks it replaced
+    if summaries is not None:
+        rebuild_summary_table(output_dir, names.values())
+    else:
+        rebuild_runs_table(output_dir, names.values())
@@ -0,0 +1,38 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from array_cascades import BatchThresholdSim
+from bitparallel import BitThresholdSim
+
+GRAPHS = [
+    lambda: nx.watts_strogatz_graph(400, 12, .1, seed=1),
+    lambda: nx.powerlaw_cluster_graph(300, 4, .1, seed=2),
+]
+
+@pytest.mark.parametrize('make_graph', GRAPHS)
+def test_bits_matches_float(make_graph, n_reps=130):
+    """
+    Same active sets and exposures as BatchThresholdSim. n_reps > 128 spans
+    three words, the last one partial
+    """
+    g = make_graph()
+    rng = np.random.default_rng(0)
+    n = g.number_of_nodes()
+    thresholds = rng.normal(3, 1.5, (n, n_reps))
+    thresholds[rng.random((n, n_reps)) < .02] = 0
+    floats = BatchThresholdSim(g, thresholds, rng=rng).dynamics()
+    bits = BitThresholdSim(g, thresholds, rng=rng).dynamics()
+    for rep in range(n_reps):
+        expected = floats.replicate_columns(rep)
+        got = bits.replicate_columns(rep)
+        for col in [
+            'active',
+            'before_exposure',
+            'exposure_at_activation',
+            'threshold',
+        ]:
+            assert np.array_equal(expected[col], got[col], equal_nan=True)
+        order = got['activation_order']
+        n_active = int(got['active'].sum())
+        assert sorted(order[~np.isnan(order)]) == list(range(1, n_active + 1))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from graph_generators import watts_strogatz
+
+def edge_set(g):
+    src = np.repeat(np.arange(g.n), g.degree)
+    return set(zip(src.tolist(), g.indices.tolist()))
+
+def assert_simple(g):
+    src = np.repeat(np.arange(g.n), g.degree)
+    assert not (src == g.indices).any(), 'self loop'
+    keys = src * g.n + g.indices
+    assert len(np.unique(keys)) == len(keys), 'multi-edge'
+
+def test_watts_strogatz_no_rewiring_is_the_lattice():
+    n, k = 50, 6
+    g = watts_strogatz(n, k, 0.0, rng=np.random.default_rng(0))
+    lattice = set()
+    for u in range(n):
+        for j in range(1, k // 2 + 1):
+            lattice.add((u, (u + j) % n))
+            lattice.add(((u + j) % n, u))
+    assert edge_set(g) == lattice
+
+@pytest.mark.parametrize('seed', range(5))
+def test_watts_strogatz_full_rewiring(seed):
+    n, k = 60, 8
+    g = watts_strogatz(n, k, 1.0, rng=np.random.default_rng(seed))
+    assert_simple(g)
+    assert len(g.indices) == n * k
+
+def test_watts_strogatz_full_rewiring_of_a_complete_graph():
+    # every node is linked to everyone, so nothing can be rewired
+    n = 7
+    g = watts_strogatz(n, n - 1, 1.0, rng=np.random.default_rng(0))
+    assert_simple(g)
+    assert (g.degree == n - 1).all()
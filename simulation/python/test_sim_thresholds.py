@@ -0,0 +1,156 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from sim_thresholds import run_sim, async_simulation,\
+                           async_simulation_incremental,\
+                           async_simulation_skip, create_thresholds,\
+                           label_graph_with_thresholds
+
+"""
+The fast async engines against the plain one. Everything is seeded, so a
+failure is a real change in engine output, not noise
+"""
+
+CHECK_EQ = {
+    'epsilon': {'distribution': 'epsilon',
+                'mean': 0,
+                'sd': 1.0,
+                'coefficient': None},
+    'var1': {'distribution': 'normal',
+             'mean': 0,
+             'sd': 1.0,
+             'coefficient': 1.0},
+    'constant': {'distribution': 'constant',
+                 'mean': None,
+                 'sd': None,
+                 'coefficient': 3},
+}
+
+GRAPHS = [
+    lambda: nx.watts_strogatz_graph(400, 12, .1, seed=1),
+    lambda: nx.powerlaw_cluster_graph(300, 4, .1, seed=2),
+]
+
+OUTCOMES = [
+    'activated',
+    'before_activation_alters',
+    'after_activation_alters',
+    'activation_order',
+]
+
+@pytest.mark.parametrize('make_graph', GRAPHS)
+def test_incremental_matches_async(make_graph, n_seeds=5):
+    """
+    Same random state, same outcomes
+    """
+    g = make_graph()
+    n = g.number_of_nodes()
+    for seed in range(n_seeds):
+        labeled = label_graph_with_thresholds(
+            g.copy(),
+            create_thresholds(n, CHECK_EQ, np.random.default_rng(seed)),
+        )
+        runs = []
+        for engine in [async_simulation, async_simulation_incremental]:
+            np.random.seed(seed)
+            runs.append(engine(labeled.copy()))
+        for node in g.nodes():
+            for col in OUTCOMES:
+                assert runs[0].node[node][col] == runs[1].node[node][col]
+
+def replay_skip_passes(g, rng):
+    """
+    async_simulation_skip without the skipping: the same shuffled passes,
+    drawn the same way, but every visit done one at a time
+    Returns {node: (activated, before, after, activation_order)}
+    """
+    nodes = g.nodes()
+    index = {node: idx for idx, node in enumerate(nodes)}
+    n = len(nodes)
+    threshold = np.array([g.node[node]['threshold'] for node in nodes])
+    exposure = np.zeros(n, dtype=np.int64)
+    activated = np.zeros(n, dtype=bool)
+    before = [None] * n
+    after = [None] * n
+    order = [None] * n
+    n_activated = 0
+    steps_without_activation = 0
+    while not activated.all():
+        for ego in rng.permutation(np.flatnonzero(~activated)):
+            if exposure[ego] >= threshold[ego]:
+                activated[ego] = True
+                after[ego] = int(exposure[ego])
+                n_activated += 1
+                order[ego] = n_activated
+                for alter in g[nodes[ego]]:
+                    exposure[index[alter]] += 1
+                steps_without_activation = 0
+            else:
+                before[ego] = int(exposure[ego])
+                steps_without_activation += 1
+                if steps_without_activation > n:
+                    break
+        if steps_without_activation > n:
+            break
+    return {
+        node: (int(activated[idx]), before[idx], after[idx], order[idx])
+        for idx, node in enumerate(nodes)
+    }
+
+@pytest.mark.parametrize('make_graph', GRAPHS)
+def test_skip_matches_replay(make_graph, n_seeds=10):
+    """
+    Same rng, same records as replaying skip's passes visit by visit
+    Catches heap and stop rule bugs that a distribution check can miss
+    """
+    g = make_graph()
+    n = g.number_of_nodes()
+    for seed in range(n_seeds):
+        labeled = label_graph_with_thresholds(
+            g.copy(),
+            create_thresholds(n, CHECK_EQ, np.random.default_rng(seed)),
+        )
+        expected = replay_skip_passes(
+            labeled.copy(),
+            np.random.default_rng(seed + 1),
+        )
+        got = async_simulation_skip(
+            labeled,
+            rng=np.random.default_rng(seed + 1),
+        )
+        for node, values in expected.items():
+            attrs = got.node[node]
+            assert values == (
+                attrs['activated'],
+                attrs['before_activation_alters'],
+                attrs['after_activation_alters'],
+                attrs['activation_order'],
+            )
+
+def test_skip_matches_async(n_seeds=100, max_se=4):
+    """
+    skip draws its visits differently, so only the distribution matches
+    Per-run means of the outcome columns agree within max_se standard errors
+    """
+    g = GRAPHS[1]()
+    cols = ['activated', 'observed', 'before_activation_alters']
+    means = {}
+    for engine in ['async', 'skip']:
+        per_run = []
+        for seed in range(n_seeds):
+            np.random.seed(seed + 1000)
+            records = run_sim(g.copy(), CHECK_EQ, engine=engine)
+            per_run.append([
+                np.mean([
+                    record[col] for record in records
+                    if record[col] is not None
+                ])
+                for col in cols
+            ])
+        means[engine] = np.array(per_run)
+    for idx, col in enumerate(cols):
+        a = means['async'][:, idx]
+        b = means['skip'][:, idx]
+        se = np.sqrt((a.var(ddof=1) + b.var(ddof=1)) / n_seeds)
+        assert abs(a.mean() - b.mean()) <= max_se * se, col
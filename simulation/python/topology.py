@@ -0,0 +1,209 @@
+import hashlib
+import os
+import networkx as nx
+import numpy as np
+import scipy.sparse as sp
+
+"""
+Array-backed graph topology for the simulation engines
+
+A CSRGraph freezes a NetworkX graph into compressed sparse row arrays:
+    indices[indptr[i]:indptr[i + 1]] are the neighbors of node i
+    nodes[i] is the original NetworkX label of node i
+
+Engines index all node state by position 0..n-1 and only translate back to
+NetworkX labels when writing output.
+
+A CSRGraph is immutable (its arrays are flagged read-only), so build one per
+graph and hand it to every model that runs on that graph. Each model only
+allocates its own state arrays on top of it.
+
+save/load round trip a CSRGraph through an uncompressed .npz, which is about
+as small as the graph gets and loads without any parsing.
+
+Classes:
+    - CSRGraph
+
+Functions:
+    - as_topology
+    - stack_topologies
+"""
+
+class CSRGraph(object):
+    """
+    - inputs
+        indptr: row pointer array, length n + 1
+        indices: concatenated neighbor lists, length 2 * number of edges
+        nodes: original node labels in index order, defaults to 0..n-1
+    """
+    def __init__(self, indptr, indices, nodes=None):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.n = len(self.indptr) - 1
+        self.degree = np.diff(self.indptr)
+        if nodes is None:
+            nodes = np.arange(self.n)
+        self.nodes = np.asarray(nodes)
+        for arr in [self.indptr, self.indices, self.degree, self.nodes]:
+            arr.setflags(write=False)
+        self._adjacency = None
+        self._sources = None
+        self._fingerprint = None
+
+    def __len__(self):
+        return self.n
+
+    @classmethod
+    def from_edges(cls, n, src, dst, nodes=None):
+        """
+        Builds the CSR arrays from an undirected edge list
+        Each edge is stored in both directions, self loops only once
+        """
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        not_loop = src != dst
+        rows = np.concatenate([src, dst[not_loop]])
+        cols = np.concatenate([dst, src[not_loop]])
+        order = np.argsort(rows * n + cols, kind='stable')
+        rows = rows[order]
+        cols = cols[order]
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(indptr, cols, nodes=nodes)
+
+    @classmethod
+    def from_networkx(cls, g):
+        """
+        Freezes the topology of a NetworkX graph, node attributes are ignored
+        """
+        nodes = list(g.nodes())
+        index = {node: idx for idx, node in enumerate(nodes)}
+        adj = g.adj
+        degree = np.fromiter(
+            (len(adj[node]) for node in nodes),
+            dtype=np.int64,
+            count=len(nodes),
+        )
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(degree, out=indptr[1:])
+        indices = np.fromiter(
+            (index[nbr] for node in nodes for nbr in adj[node]),
+            dtype=np.int64,
+            count=indptr[-1],
+        )
+        return cls(indptr, indices, nodes=nodes)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrs:
+            return cls(arrs['indptr'], arrs['indices'], nodes=arrs['nodes'])
+
+    def save(self, path):
+        """
+        Writes to a temp file first, so readers never see a partial graph
+        """
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                indptr=self.indptr,
+                indices=self.indices,
+                nodes=self.nodes,
+            )
+        os.replace(tmp_path, path)
+
+    def to_networkx(self):
+        """
+        A fresh NetworkX graph with the same labels and no attributes
+        """
+        g = nx.Graph()
+        nodes = self.nodes.tolist()
+        g.add_nodes_from(nodes)
+        src = self.arc_sources()
+        one_way = src <= self.indices
+        g.add_edges_from(
+            zip(
+                self.nodes[src[one_way]].tolist(),
+                self.nodes[self.indices[one_way]].tolist(),
+            )
+        )
+        return g
+
+    def neighbors(self, idx):
+        return self.indices[self.indptr[idx]:self.indptr[idx + 1]]
+
+    def adjacency(self):
+        """
+        scipy.sparse CSR adjacency matrix sharing our index arrays
+        Built on first use
+        """
+        if self._adjacency is None:
+            data = np.ones(len(self.indices), dtype=np.int32)
+            self._adjacency = sp.csr_matrix(
+                (data, self.indices, self.indptr),
+                shape=(self.n, self.n),
+            )
+        return self._adjacency
+
+    def arc_sources(self):
+        """
+        Source node of every entry of indices, so arc k runs
+        arc_sources()[k] -> indices[k]
+        """
+        if self._sources is None:
+            self._sources = np.repeat(np.arange(self.n), self.degree)
+            self._sources.setflags(write=False)
+        return self._sources
+
+    def fingerprint(self):
+        """
+        sha1 of the node labels and CSR arrays
+        Computed on first use, the arrays never change after that
+        """
+        if self._fingerprint is None:
+            h = hashlib.sha1()
+            h.update(repr(self.nodes.tolist()).encode())
+            h.update(self.indptr.tobytes())
+            h.update(self.indices.tobytes())
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+def as_topology(g):
+    """
+    Returns g if it is already a CSRGraph, otherwise freezes it
+    """
+    if isinstance(g, CSRGraph):
+        return g
+    return CSRGraph.from_networkx(g)
+
+def stack_topologies(topologies):
+    """
+    Inputs:
+        topologies: [CSRGraph or graph, ...]
+
+    Outputs:
+        stacked: one CSRGraph with the graphs as disconnected blocks, its
+            adjacency is block diagonal
+        offsets: length K + 1, graph k is nodes offsets[k]:offsets[k + 1]
+
+    Lets an engine run K small graphs in one call. Labels are 0..N-1, the
+    original ones stay on the input topologies
+    """
+    topologies = [as_topology(t) for t in topologies]
+    sizes = [t.n for t in topologies]
+    offsets = np.zeros(len(topologies) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    arc_offsets = np.zeros(len(topologies) + 1, dtype=np.int64)
+    np.cumsum([len(t.indices) for t in topologies], out=arc_offsets[1:])
+    indptr = np.concatenate(
+        [[0]] + [
+            t.indptr[1:] + arc_offset
+            for t, arc_offset in zip(topologies, arc_offsets)
+        ]
+    )
+    indices = np.concatenate(
+        [np.zeros(0, dtype=np.int64)] + [
+            t.indices + offset for t, offset in zip(topologies, offsets)
+        ]
+    )
+    return CSRGraph(indptr, indices), offsets
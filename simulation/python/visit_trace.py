@@ -0,0 +1,93 @@
+import os
+import numpy as np
+import pandas as pd
+
+"""
+Binary trace of every node visit of an async run
+
+A trace file is a flat array of fixed-width TRACE_DTYPE records, one per
+visit, with no header:
+    iteration: visit number, from 1
+    node: node index, position in the graph's node order
+    exposure: active neighbors at the visit
+    activated: 1 if the node activated on this visit
+
+TraceRecorder appends records into a preallocated buffer and writes it out
+one large block at a time, so recording a visit costs a tuple store instead
+of a csv row. Readers memory-map the file and hand out pandas frames one
+chunk at a time, so traces of 1e6-node runs never have to fit in memory
+
+Per-node columns (threshold, covariates, ...) aren't repeated per visit,
+join them on node from the run's node table
+
+Classes:
+    - TraceRecorder
+
+Functions:
+    - read_trace
+    - yield_trace_frames
+"""
+
+TRACE_DTYPE = np.dtype([
+    ('iteration', '<i8'),
+    ('node', '<i4'),
+    ('exposure', '<i4'),
+    ('activated', 'i1'),
+])
+
+class TraceRecorder(object):
+    """
+    - inputs
+        path: trace file, truncated on open
+        buffer_size: records held before a block is written
+
+    Use as a context manager, or call close() to write the last block
+    """
+    def __init__(self, path, buffer_size=2**20):
+        self.path = path
+        self.buffer = np.zeros(buffer_size, dtype=TRACE_DTYPE)
+        self.pos = 0
+        self.n_records = 0
+        self.f = open(self.path, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def record(self, iteration, node, exposure, activated):
+        self.buffer[self.pos] = (iteration, node, exposure, activated)
+        self.pos += 1
+        if self.pos == len(self.buffer):
+            self.flush()
+
+    def flush(self):
+        self.buffer[:self.pos].tofile(self.f)
+        self.n_records += self.pos
+        self.pos = 0
+
+    def close(self):
+        if self.f.closed:
+            return
+        self.flush()
+        self.f.close()
+
+def read_trace(path):
+    """
+    Read-only memmap of TRACE_DTYPE records, empty array for an empty file
+    """
+    if os.path.getsize(path) == 0:
+        return np.zeros(0, dtype=TRACE_DTYPE)
+    return np.memmap(path, dtype=TRACE_DTYPE, mode='r')
+
+def yield_trace_frames(path, chunk_rows=2**20):
+    """
+    Yields the trace as DataFrames of up to chunk_rows visits, in order
+    """
+    trace = read_trace(path)
+    for start in range(0, len(trace), chunk_rows):
+        chunk = trace[start:start + chunk_rows]
+        yield pd.DataFrame({
+            name: np.asarray(chunk[name]) for name in TRACE_DTYPE.names
+        })